@@ -23,6 +23,7 @@
 ######################################################################################
 
 from . import evtk
+from . import export
 from . import hl
 from . import vtk
 from . import xml
@@ -23,8 +23,13 @@
 ######################################################################################
 """Export routines."""
 
+import errno
+import os
 import sys
 import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 # import base64
 import numpy as np
@@ -44,6 +49,13 @@ np_to_struct = {
 }
 
 
+# Size in bytes of the scratch buffers used to encode arrays
+_BUFFER_SIZE = 4 * 1024**2
+
+# Size in bytes of the tiles of a blocked transpose, about the size of a L2 cache
+_TILE_SIZE = 256 * 1024
+
+
 def _get_byte_order_char():
     # Check format in https://docs.python.org/3.5/library/struct.html
     if sys.byteorder == "little":
@@ -51,9 +63,417 @@ def _get_byte_order_char():
     return ">"
 
 
+def _native_ravel(data):
+    """
+    Return a 1D view or copy of data in FORTRAN order and native byte order.
+
+    No copy is made when data is already one dimensional or FORTRAN
+    contiguous and stored in native byte order. Otherwise the transpose and
+    the byteswap are done in a single pass.
+    """
+    dtype = data.dtype.newbyteorder("=")
+    dd = data.astype(dtype, order="F", copy=False)
+    return np.ravel(dd, order="F")
+
+
+def _iter_slabs(data, nitems):
+    """
+    Split an array into consecutive pieces in FORTRAN order.
+
+    Each piece is a view of data with at most nitems elements,
+    and the pieces follow each other in the order expected by VTK.
+    Multidimensional arrays are split along the last axis first.
+    """
+    if data.size <= nitems:
+        yield data
+    elif data.ndim == 1:
+        for i in range(0, data.size, nitems):
+            yield data[i : i + nitems]
+    else:
+        nplane = data.size // data.shape[-1]
+        if nplane <= nitems:
+            step = nitems // nplane
+            for k in range(0, data.shape[-1], step):
+                yield data[..., k : k + step]
+        else:
+            for k in range(data.shape[-1]):
+                yield from _iter_slabs(data[..., k], nitems)
+
+
+def _iter_tiles(shape, itemsize):
+    """
+    Split a 3D array shape in tiles of about _TILE_SIZE bytes.
+
+    Yields tuples of slices in FORTRAN order. Tiles span 64 items along
+    the first and last axes, which vary fastest in the FORTRAN ordered
+    output and in a C ordered input, so that both the reads and the writes
+    of a tile stay in cache.
+    """
+    edge = 64
+    tile = (edge, max(1, _TILE_SIZE // (itemsize * edge * edge)), edge)
+    for k in range(0, shape[2], tile[2]):
+        for j in range(0, shape[1], tile[1]):
+            for i in range(0, shape[0], tile[0]):
+                yield (
+                    slice(i, i + tile[0]),
+                    slice(j, j + tile[1]),
+                    slice(k, k + tile[2]),
+                )
+
+
+def _copy_tile(out, data, tile):
+    """Copy one tile of data to out."""
+    out[tile] = data[tile]
+
+
+def _iter_transposed(slabs, workers=None):
+    """
+    Copy slabs of a 3D array to 1D arrays in FORTRAN order and native byte order.
+
+    This is a blocked transpose: each slab is copied tile by tile,
+    see _iter_tiles, and the tiles are copied by a pool of threads
+    if workers is given.
+    """
+    executor = None
+    if workers is not None and workers > 1:
+        executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for slab in slabs:
+            if slab.ndim < 3:  # slabs of less than a plane are small
+                yield _native_ravel(slab)
+                continue
+            dtype = slab.dtype.newbyteorder("=")
+            out = np.empty(slab.shape, dtype=dtype, order="F")
+            tiles = _iter_tiles(slab.shape, dtype.itemsize)
+            copy = partial(_copy_tile, out, slab)
+            if executor is None:
+                for tile in tiles:
+                    copy(tile)
+            else:
+                for _ in executor.map(copy, tiles):
+                    pass
+            yield np.ravel(out, order="F")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def _sample_slabs(data, nitems, nsamples):
+    """Return up to nsamples slabs with at most nitems elements, spread over data."""
+    if data.size <= nitems:
+        return [data]
+    if data.ndim == 1:
+        starts = np.linspace(0, data.size - nitems, nsamples).astype(int)
+        return [data[i : i + nitems] for i in np.unique(starts)]
+    planes = np.linspace(0, data.shape[-1] - 1, nsamples).astype(int)
+    return [next(_iter_slabs(data[..., k], nitems)) for k in np.unique(planes)]
+
+
+def _as_fortran_indexed(data, order):
+    """
+    Return a view of data that is traversed in FORTRAN order by VTK.
+
+    Arrays indexed as data[k, j, i] (order="C") are transposed,
+    which is free and makes C contiguous arrays FORTRAN contiguous.
+    """
+    assert order in ("F", "C"), "order must be 'F' or 'C'"
+    if order == "C":
+        return data.T
+    return data
+
+
+def _interleave(components, dtype, block=None):
+    """
+    Interleave the components of a vector field slab.
+
+    Returns an (n, 3) C contiguous array with the given data type.
+    If block is given, it is used as scratch memory instead of a new array.
+    """
+    n = components[0].size
+    if block is None:
+        block = np.empty((n, 3), dtype=dtype)
+    else:
+        block = block[:n]
+    for i, component in enumerate(components):
+        # FORTRAN ordered view of the column, so the copy needs no temporary
+        column = block[:, i].reshape(component.shape, order="F")
+        column[...] = component
+    return block
+
+
+def _imap(func, iterable, workers=None):
+    """
+    Ordered map that calls func in a pool of threads.
+
+    At most 2 * workers results are pending at any time,
+    which bounds the memory used by results that were not consumed yet.
+    NumPy copies and compressors release the GIL, so this scales
+    with the number of cores. If workers is None or 1, this is map.
+    """
+    if workers is None or workers <= 1:
+        yield from map(func, iterable)
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for item in iterable:
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+            pending.append(executor.submit(func, item))
+        while pending:
+            yield pending.popleft().result()
+
+
+def _as_bytes(data):
+    """Return a byte view of a contiguous array, suitable for stream.write."""
+    return memoryview(data).cast("B")
+
+
+def _iter_array_chunks(data, buffer_size=None, order="F", workers=None):
+    """
+    Encode a scalar array as a sequence of byte chunks in VTK order.
+
+    See writeArrayToFile for the meaning of the arguments.
+    """
+    assert data.ndim == 1 or data.ndim == 3
+    assert data.dtype.name in np_to_struct, "Unsupported data type: " + str(data.dtype)
+
+    # Check if array is contiguous
+    assert data.flags["C_CONTIGUOUS"] or data.flags["F_CONTIGUOUS"]
+
+    # NOTE: VTK expects data in FORTRAN order
+    # This is only needed when a multidimensional array has C-layout
+    data = _as_fortran_indexed(data, order)
+    transpose = data.ndim == 3 and not data.flags["F_CONTIGUOUS"]
+    if buffer_size is None and (workers is None or transpose):
+        slabs = [data]
+    else:
+        if buffer_size is None:
+            buffer_size = _BUFFER_SIZE
+        slabs = _iter_slabs(data, max(1, buffer_size // data.dtype.itemsize))
+    if transpose:
+        # C ordered array: strided copy, done in cache sized tiles
+        chunks = _iter_transposed(slabs, workers)
+    else:
+        chunks = _imap(_native_ravel, slabs, workers)
+    for dd in chunks:
+        yield _as_bytes(dd)
+
+
+def _iter_arrays_chunks(
+    x, y, z, buffer_size=None, order="F", workers=None, scratch=True
+):
+    """
+    Encode the components of a vector field as interleaved byte chunks.
+
+    See writeArraysToFile for the meaning of the arguments.
+    If scratch is True, chunks may share scratch memory, so each chunk
+    must be consumed before the next one is requested.
+    """
+    # Check if arrays have same shape and data type
+    assert x.size == y.size == z.size, "Different array sizes."
+    assert (
+        x.dtype.itemsize == y.dtype.itemsize == z.dtype.itemsize
+    ), "Different item sizes."
+    assert x.dtype.name in np_to_struct, "Unsupported data type: " + str(x.dtype)
+
+    # Check if arrays are contiguous
+    assert x.flags["C_CONTIGUOUS"] or x.flags["F_CONTIGUOUS"]
+    assert y.flags["C_CONTIGUOUS"] or y.flags["F_CONTIGUOUS"]
+    assert z.flags["C_CONTIGUOUS"] or z.flags["F_CONTIGUOUS"]
+
+    # NOTE: VTK expects data in FORTRAN order
+    # This is only needed when a multidimensional array has C-layout
+    x, y, z = (_as_fortran_indexed(a, order) for a in (x, y, z))
+    if not x.shape == y.shape == z.shape:
+        x, y, z = (np.ravel(a, order="F") for a in (x, y, z))
+
+    # Interleave the components into a bounded (n, 3) scratch block.
+    # All components are stored with the data type of x.
+    dtype = x.dtype.newbyteorder("=")
+    if buffer_size is None:
+        buffer_size = _BUFFER_SIZE
+    nitems = max(1, buffer_size // (3 * dtype.itemsize))
+    slabs = zip(*(_iter_slabs(a, nitems) for a in (x, y, z)))
+    if scratch and (workers is None or workers <= 1):
+        scratch = np.empty((min(nitems, x.size), 3), dtype=dtype)
+        blocks = (_interleave(slab, dtype, scratch) for slab in slabs)
+    else:
+        blocks = _imap(partial(_interleave, dtype=dtype), slabs, workers)
+    for block in blocks:
+        yield _as_bytes(block)
+
+
+def _iter_blocks(chunks, block_size):
+    """
+    Regroup a sequence of byte chunks in blocks of block_size bytes.
+
+    Only the last block may be shorter. Blocks that lie within
+    a single chunk are yielded as views of that chunk.
+    """
+    pending = bytearray()
+    for chunk in chunks:
+        chunk = memoryview(chunk).cast("B")
+        if pending:
+            n = block_size - len(pending)
+            pending += chunk[:n]
+            chunk = chunk[n:]
+            if len(pending) < block_size:
+                continue
+            yield bytes(pending)
+            pending = bytearray()
+        n = len(chunk) - len(chunk) % block_size
+        for i in range(0, n, block_size):
+            yield chunk[i : i + block_size]
+        pending += chunk[n:]
+    if pending:
+        yield bytes(pending)
+
+
+def _compress_chunks(chunks, compress, block_size, workers=None):
+    """
+    Compress a sequence of byte chunks with the layout used by VTK compressors.
+
+    Returns a list of bytes objects: a UInt64 header with the number of
+    blocks, the uncompressed block size, the size of the last partial block
+    and the compressed size of each block, followed by the compressed blocks.
+    Blocks are compressed by a pool of threads if workers is given.
+    The chunks must not share memory in that case.
+    """
+    last_size = 0
+
+    def tracked_blocks():
+        nonlocal last_size
+        for block in _iter_blocks(chunks, block_size):
+            last_size = len(block)
+            yield block
+
+    blocks = list(_imap(compress, tracked_blocks(), workers))
+    if last_size == block_size:
+        last_size = 0  # the last block is not partial
+    sizes = [len(b) for b in blocks]
+    fmt = _get_byte_order_char() + "%dQ" % (3 + len(blocks))
+    header = struct.pack(fmt, len(blocks), block_size, last_size, *sizes)
+    return [header] + blocks
+
+
 # ================================
 #        Python interface
 # ================================
+class PositionalWriter:
+    """
+    Stream that writes to a file descriptor at a given position.
+
+    Writes use os.pwrite, so they do not move the file offset
+    and several writers can fill disjoint regions of the same file
+    from different threads.
+
+    Parameters
+    ----------
+    fd : int
+        file descriptor open for writing.
+    position : int
+        position in bytes of the first write.
+    """
+
+    def __init__(self, fd, position):
+        self.fd = fd
+        self.position = position
+
+    def write(self, data):
+        """Write a bytes-like object and advance the position."""
+        data = memoryview(data).cast("B")
+        while data:
+            n = os.pwrite(self.fd, data, self.position)
+            self.position += n
+            data = data[n:]
+
+
+class GatherWriter:
+    """
+    Stream that gathers writes and submits them with os.writev.
+
+    Written objects are kept by reference until the writer is flushed,
+    so they must not be modified in the meantime.
+    The writer is flushed when it holds max_buffers objects
+    or max_bytes bytes, which keeps the number of system calls low
+    when many small arrays are written.
+
+    Parameters
+    ----------
+    fd : int
+        file descriptor open for writing, positioned at the first write.
+    max_buffers : int, optional
+        maximum number of pending objects.
+        The default is None, which uses the system limit (IOV_MAX).
+    max_bytes : int, optional
+        maximum number of pending bytes. The default is 64 MiB.
+    """
+
+    def __init__(self, fd, max_buffers=None, max_bytes=16 * _BUFFER_SIZE):
+        if max_buffers is None:
+            try:
+                max_buffers = os.sysconf("SC_IOV_MAX")
+            except (AttributeError, ValueError, OSError):
+                max_buffers = 16
+            if max_buffers <= 0:  # no limit reported
+                max_buffers = 1024
+        self.fd = fd
+        self.max_buffers = max_buffers
+        self.max_bytes = max_bytes
+        self.buffers = []
+        self.nbytes = 0
+
+    def write(self, data):
+        """Queue a bytes-like object to be written."""
+        data = memoryview(data).cast("B")
+        if not data:
+            return
+        self.buffers.append(data)
+        self.nbytes += len(data)
+        if len(self.buffers) >= self.max_buffers or self.nbytes >= self.max_bytes:
+            self.flush()
+
+    def flush(self):
+        """Write all pending objects."""
+        buffers = self.buffers
+        while buffers:
+            n = os.writev(self.fd, buffers)
+            # drop what was written, the last buffer may be partially written
+            i = 0
+            while i < len(buffers) and n >= len(buffers[i]):
+                n -= len(buffers[i])
+                i += 1
+            buffers = buffers[i:]
+            if n:
+                buffers[0] = buffers[0][n:]
+        self.buffers = []
+        self.nbytes = 0
+
+
+def preallocateFile(fd, size):
+    """
+    Reserve size bytes for a file.
+
+    Uses posix_fallocate where supported, so later positional writes
+    do not fail for lack of space, and ftruncate otherwise.
+
+    Parameters
+    ----------
+    fd : int
+        file descriptor open for writing.
+    size : int
+        final size in bytes of the file.
+    """
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError as e:  # not supported by this file system
+            if e.errno not in (errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+    os.ftruncate(fd, size)
+
+
 def writeBlockSize(stream, block_size):
     """
     Write block size to a given stream.
@@ -71,7 +491,7 @@ def writeBlockSize(stream, block_size):
     stream.write(struct.pack(fmt, block_size))
 
 
-def writeArrayToFile(stream, data):
+def writeArrayToFile(stream, data, buffer_size=None, order="F", workers=None):
     """
     Write array to a given stream.
 
@@ -81,26 +501,33 @@ def writeArrayToFile(stream, data):
         open stream.
     data : array-like
         data array to be saved.
+    buffer_size : int, optional
+        maximum size in bytes of the scratch memory used to
+        reorder and byteswap the data.
+        If given, the array is written slab by slab.
+        The default is None, which writes the array in one piece.
+    order : {"F", "C"}, optional
+        order in which the indices of a 3D array are traversed
+        to obtain the VTK ordering, where x varies fastest.
+        "F" means the array is indexed as data[i, j, k],
+        "C" means it is indexed as data[k, j, i], which lets
+        C contiguous arrays be written without a transposed copy.
+        The default is "F".
+    workers : int, optional
+        number of threads used to transpose and byteswap the array.
+        3D arrays that are not FORTRAN contiguous, e.g. C ordered
+        arrays indexed as data[i, j, k], are transposed in tiles of
+        about 256 KiB that are copied concurrently. Other arrays are split
+        in slabs of buffer_size bytes (4 MiB by default).
+        The default is None, which does all the work in the calling thread.
     """
     # stream.flush() # this should not be necessary
-    assert data.ndim == 1 or data.ndim == 3
-    fmt = (
-        _get_byte_order_char() + str(data.size) + np_to_struct[data.dtype.name]
-    )  # > for big endian
-
-    # Check if array is contiguous
-    assert data.flags["C_CONTIGUOUS"] or data.flags["F_CONTIGUOUS"]
-
-    # NOTE: VTK expects data in FORTRAN order
-    # This is only needed when a multidimensional array has C-layout
-    dd = np.ravel(data, order="F")
-
-    bin_pack = struct.pack(fmt, *dd)
-    stream.write(bin_pack)
+    for chunk in _iter_array_chunks(data, buffer_size, order, workers):
+        stream.write(chunk)
 
 
 # ==============================================================================
-def writeArraysToFile(stream, x, y, z):
+def writeArraysToFile(stream, x, y, z, buffer_size=None, order="F", workers=None):
     """
     Write multiple array to a given stream.
 
@@ -114,36 +541,196 @@ def writeArraysToFile(stream, x, y, z):
         y array to be saved.
     z : array-like
         z array to be saved.
+    buffer_size : int, optional
+        maximum size in bytes of the scratch memory used to
+        interleave the components.
+        The default is None, which uses blocks of 4 MiB.
+    order : {"F", "C"}, optional
+        order in which the indices of 3D arrays are traversed,
+        see writeArrayToFile. The default is "F".
+    workers : int, optional
+        number of threads used to interleave the components.
+        The default is None, which does all the work in the calling thread.
     """
-    # Check if arrays have same shape and data type
-    assert x.size == y.size == z.size, "Different array sizes."
-    assert (
-        x.dtype.itemsize == y.dtype.itemsize == z.dtype.itemsize
-    ), "Different item sizes."
+    # gathered chunks are kept until they are written,
+    # so they cannot share scratch memory
+    scratch = not isinstance(stream, GatherWriter)
+    chunks = _iter_arrays_chunks(x, y, z, buffer_size, order, workers, scratch)
+    for chunk in chunks:
+        stream.write(chunk)
 
-    nitems = x.size
-    # itemsize = x.dtype.itemsize
 
-    fmt = (
-        _get_byte_order_char() + str(1) + np_to_struct[x.dtype.name]
-    )  # > for big endian
+# ==============================================================================
+def compressArrayToBlocks(
+    data,
+    compress,
+    block_size,
+    buffer_size=None,
+    order="F",
+    workers=None,
+    compression_workers=None,
+):
+    """
+    Compress an array with the blocked layout of VTK compressed data.
 
-    # Check if arrays are contiguous
-    assert x.flags["C_CONTIGUOUS"] or x.flags["F_CONTIGUOUS"]
-    assert y.flags["C_CONTIGUOUS"] or y.flags["F_CONTIGUOUS"]
-    assert z.flags["C_CONTIGUOUS"] or z.flags["F_CONTIGUOUS"]
+    Parameters
+    ----------
+    data : array-like
+        data array to be compressed.
+    compress : callable
+        function that compresses a bytes-like object.
+    block_size : int
+        size in bytes of the uncompressed blocks.
+    buffer_size : int, optional
+        see writeArrayToFile.
+    order : {"F", "C"}, optional
+        see writeArrayToFile.
+    workers : int, optional
+        see writeArrayToFile.
+    compression_workers : int, optional
+        number of threads used to compress the blocks concurrently.
+        The order of the blocks is preserved.
+        The default is None, which compresses in the calling thread.
 
-    # NOTE: VTK expects data in FORTRAN order
-    # This is only needed when a multidimensional array has C-layout
-    xx = np.ravel(x, order="F")
-    yy = np.ravel(y, order="F")
-    zz = np.ravel(z, order="F")
-
-    # eliminate this loop by creating a composed array.
-    for i in range(nitems):
-        bx = struct.pack(fmt, xx[i])
-        by = struct.pack(fmt, yy[i])
-        bz = struct.pack(fmt, zz[i])
-        stream.write(bx)
-        stream.write(by)
-        stream.write(bz)
+    Returns
+    -------
+    list
+        bytes objects to be written one after the other:
+        the block header followed by the compressed blocks.
+    """
+    chunks = _iter_array_chunks(data, buffer_size, order, workers)
+    return _compress_chunks(chunks, compress, block_size, compression_workers)
+
+
+# ==============================================================================
+def compressArraysToBlocks(
+    x,
+    y,
+    z,
+    compress,
+    block_size,
+    buffer_size=None,
+    order="F",
+    workers=None,
+    compression_workers=None,
+):
+    """
+    Compress the interleaved components of a vector field.
+
+    Parameters
+    ----------
+    x : array-like
+        x array to be compressed.
+    y : array-like
+        y array to be compressed.
+    z : array-like
+        z array to be compressed.
+    compress : callable
+        function that compresses a bytes-like object.
+    block_size : int
+        size in bytes of the uncompressed blocks.
+    buffer_size : int, optional
+        see writeArraysToFile.
+    order : {"F", "C"}, optional
+        see writeArraysToFile.
+    workers : int, optional
+        see writeArraysToFile.
+    compression_workers : int, optional
+        number of threads used to compress the blocks concurrently.
+        The order of the blocks is preserved.
+        The default is None, which compresses in the calling thread.
+
+    Returns
+    -------
+    list
+        bytes objects to be written one after the other:
+        the block header followed by the compressed blocks.
+    """
+    scratch = compression_workers is None or compression_workers <= 1
+    chunks = _iter_arrays_chunks(x, y, z, buffer_size, order, workers, scratch)
+    return _compress_chunks(chunks, compress, block_size, compression_workers)
+
+
+# ==============================================================================
+def sampleBlocks(data, block_size, nsamples=4, order="F"):
+    """
+    Encode a few blocks spread over an array, e.g. to tune compression.
+
+    Parameters
+    ----------
+    data : array-like
+        one numpy array or a tuple with 3 numpy arrays
+        with the components of a vector field.
+    block_size : int
+        approximate size in bytes of each sample.
+    nsamples : int, optional
+        number of samples. The default is 4.
+    order : {"F", "C"}, optional
+        see writeArrayToFile.
+
+    Returns
+    -------
+    list
+        bytes-like objects with the encoded samples,
+        as they would be written to the file.
+    """
+    if isinstance(data, tuple):
+        components = [_as_fortran_indexed(a, order) for a in data]
+        if not components[0].shape == components[1].shape == components[2].shape:
+            components = [np.ravel(a, order="F") for a in components]
+        dtype = components[0].dtype.newbyteorder("=")
+        nitems = max(1, block_size // (3 * dtype.itemsize))
+        slabs = zip(*(_sample_slabs(a, nitems, nsamples) for a in components))
+        return [_as_bytes(_interleave(slab, dtype)) for slab in slabs]
+
+    data = _as_fortran_indexed(data, order)
+    nitems = max(1, block_size // data.dtype.itemsize)
+    return [_as_bytes(_native_ravel(s)) for s in _sample_slabs(data, nitems, nsamples)]
+
+
+# ==============================================================================
+def roundMantissa(data, keepbits):
+    """
+    Round floating point data to a number of significant mantissa bits.
+
+    Values are rounded to nearest, ties to even, and the trailing bits
+    of the mantissa are set to zero, so the data compress much better.
+    The relative error is at most 2**-(keepbits + 1). Values that would
+    round up to infinity are clamped to the largest finite value with
+    keepbits bits, which is within the same bound.
+    NaN and infinite values are preserved.
+
+    Parameters
+    ----------
+    data : array-like
+        float32 or float64 array.
+    keepbits : int
+        number of explicit mantissa bits to keep,
+        out of 23 for float32 and 52 for float64.
+
+    Returns
+    -------
+    array-like
+        rounded copy of data in native byte order,
+        or data itself if nothing is rounded.
+    """
+    info = np.finfo(data.dtype)
+    assert 0 <= keepbits, "keepbits must be positive"
+    if keepbits >= info.nmant:
+        return data
+    # the bits are only meaningful in native byte order
+    dtype = data.dtype.newbyteorder("=")
+    data = data.astype(dtype, copy=False)
+    utype = np.dtype("u%d" % dtype.itemsize).type
+    one = utype(1)
+    drop = utype(info.nmant - keepbits)
+    mask = ~((one << drop) - one)
+    bits = data.view(utype)
+    half = (one << (drop - one)) - one
+    rounded = bits + (half + ((bits >> drop) & one))
+    rounded &= mask
+    rounded = rounded.view(dtype)
+    finite = np.isfinite(data)
+    largest = (np.array(info.max, dtype=dtype).view(utype) & mask).view(dtype)
+    rounded = np.where(finite & np.isinf(rounded), np.copysign(largest, data), rounded)
+    return np.where(finite, rounded, data)
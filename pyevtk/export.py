@@ -0,0 +1,622 @@
+######################################################################################
+# MIT License
+#
+# Copyright (c) 2010-2024 Paulo A. Herrera
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+######################################################################################
+"""Export files in the background while the computation goes on."""
+
+import asyncio
+import itertools
+import multiprocessing
+import os
+import threading
+import weakref
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from .hl import (
+    imageToVTK,
+    gridToVTK,
+    pointsToVTK,
+    linesToVTK,
+    polyLinesToVTK,
+    unstructuredGridToVTK,
+    cylinderToVTK,
+)
+from .vtk import VtkGroup
+
+# names of the arguments of the export functions that hold data arrays
+_DATA_ARGS = ("cellData", "pointData", "fieldData", "data")
+
+
+def _isArrays(value):
+    # An array or a tuple or list of arrays, e.g. the components of a vector
+    if isinstance(value, (tuple, list)):
+        return all(isinstance(v, np.ndarray) for v in value)
+    return isinstance(value, np.ndarray)
+
+
+def _isData(value):
+    # Arrays, or a dictionary of data arrays passed as a positional argument
+    if isinstance(value, dict):
+        return bool(value) and all(_isArrays(v) for v in value.values())
+    return _isArrays(value)
+
+
+# ================================
+#        BufferPool class
+# ================================
+class BufferPool:
+    """
+    Pool of arrays reused to snapshot data of the same shape and type.
+
+    Parameters
+    ----------
+    maxbuffers : int, optional
+        Maximum number of idle buffers kept for each shape and type.
+        The default is 4.
+    """
+
+    def __init__(self, maxbuffers=4):
+        self.maxbuffers = maxbuffers
+        self.buffers = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _key(a):
+        return a.shape, a.dtype.str, a.flags["F_CONTIGUOUS"] and a.ndim > 1
+
+    def copy(self, a):
+        """Return a copy of an array in a buffer of the pool."""
+        with self.lock:
+            free = self.buffers.get(self._key(a))
+            buffer = free.pop() if free else None
+        if buffer is None:
+            buffer = np.empty_like(a, order="K")
+        np.copyto(buffer, a)
+        return buffer
+
+    def release(self, buffer):
+        """Return a buffer to the pool."""
+        with self.lock:
+            free = self.buffers.setdefault(self._key(buffer), [])
+            if len(free) < self.maxbuffers:
+                free.append(buffer)
+
+
+# ================================
+#        VtkExporter class
+# ================================
+class VtkExporter:
+    """
+    Export files in background threads.
+
+    The arrays passed to submit are snapshot before it returns,
+    so the caller can go on modifying them while the file is written.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        Maximum number of exports that are queued or being written.
+        submit blocks until an export finishes when it is reached,
+        which bounds the memory used by snapshots.
+        The default is 2.
+    workers : int, optional
+        Number of writer threads. The default is 1.
+    copy : bool, optional
+        Whether to snapshot the arrays by copying them into pooled buffers.
+        If False, the exporter takes ownership of the arrays,
+        which must not be modified until the export is done.
+        The default is True.
+
+    Examples
+    --------
+    >>> with VtkExporter() as exporter:
+    ...     for step in range(nsteps):
+    ...         solve(p)
+    ...         exporter.submit(imageToVTK, "p%04d" % step, cellData={"p": p})
+    """
+
+    def __init__(self, maxsize=2, workers=1, copy=True):
+        self.maxsize = maxsize
+        self.copy = copy
+        self.pool = BufferPool(maxsize) if copy else None
+        self.slots = threading.BoundedSemaphore(maxsize)
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="pyevtk"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def _snapshot(self, value, buffers):
+        """Copy the arrays in value, recording the buffers used."""
+        if isinstance(value, np.ndarray):
+            buffer = self.pool.copy(value)
+            buffers.append(buffer)
+            return buffer
+        if isinstance(value, tuple):
+            return tuple(self._snapshot(v, buffers) for v in value)
+        if isinstance(value, list):
+            return [self._snapshot(v, buffers) for v in value]
+        if isinstance(value, dict):
+            return {k: self._snapshot(v, buffers) for k, v in value.items()}
+        return value
+
+    def _snapshotArgs(self, args, kwargs, buffers):
+        """
+        Copy the arrays of the arguments of an export function.
+
+        Only arrays, sequences of arrays and the data dictionaries are
+        copied. Other arguments, e.g. the dictionaries that the export
+        fills such as templates, are passed by reference.
+        """
+        args = tuple(self._snapshot(a, buffers) if _isData(a) else a for a in args)
+        kwargs = {
+            k: self._snapshot(v, buffers) if k in _DATA_ARGS or _isData(v) else v
+            for k, v in kwargs.items()
+        }
+        return args, kwargs
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Call an export function in the background.
+
+        Parameters
+        ----------
+        func : callable
+            export function, e.g. imageToVTK.
+        *args, **kwargs
+            arguments of func. Arrays, including those in tuples,
+            lists and dictionaries, are snapshot.
+
+        Returns
+        -------
+        concurrent.futures.Future
+            Future of the value returned by func,
+            e.g. the path of the saved file.
+        """
+        self.slots.acquire()
+        return self._start(func, args, kwargs, self._done)
+
+    def _start(self, func, args, kwargs, done):
+        """
+        Snapshot the arguments and submit func to the writer threads.
+
+        done is called with the snapshot buffers once func returned.
+        """
+        buffers = []
+        try:
+            if self.copy:
+                args, kwargs = self._snapshotArgs(args, kwargs, buffers)
+            future = self.executor.submit(func, *args, **kwargs)
+        except BaseException:
+            done(buffers)
+            raise
+        future.add_done_callback(lambda f: done(buffers))
+        return future
+
+    def _done(self, buffers):
+        """Release the buffers and the slot of a finished export."""
+        for buffer in buffers:
+            self.pool.release(buffer)
+        self.slots.release()
+
+    def shutdown(self, wait=True):
+        """
+        Stop accepting exports.
+
+        Parameters
+        ----------
+        wait : bool, optional
+            Whether to wait for the pending exports.
+            The default is True.
+        """
+        self.executor.shutdown(wait=wait)
+
+
+# ================================
+#        asyncio interface
+# ================================
+class VtkAsyncExporter(VtkExporter):
+    """
+    Export files from asyncio code without blocking the event loop.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        Maximum number of exports that are being written.
+        Further exports wait without blocking the event loop.
+        The default is 4.
+    workers : int, optional
+        Number of writer threads. The default is None, which uses maxsize.
+    copy : bool, optional
+        Whether to snapshot the arrays, see VtkExporter.
+        The default is True.
+
+    Notes
+    -----
+    Cancelling an export that waits for a slot prevents it from running.
+    Once the file is being written, cancelling only stops waiting for it:
+    the writer thread completes the file and keeps its slot until then.
+    Before Python 3.10, the exporter must be created in the event loop
+    where it is used.
+    """
+
+    def __init__(self, maxsize=4, workers=None, copy=True):
+        super().__init__(maxsize, workers or maxsize, copy)
+        self.slots = asyncio.Semaphore(maxsize)
+
+    async def submit(self, func, *args, **kwargs):
+        """
+        Call an export function in a writer thread and await it.
+
+        Parameters
+        ----------
+        func : callable
+            export function, e.g. imageToVTK.
+        *args, **kwargs
+            arguments of func, see VtkExporter.submit.
+
+        Returns
+        -------
+        object
+            The value returned by func, e.g. the path of the saved file.
+        """
+        loop = asyncio.get_running_loop()
+        await self.slots.acquire()
+
+        def done(buffers):
+            loop.call_soon_threadsafe(self._done, buffers)
+
+        future = self._start(func, args, kwargs, done)
+        return await asyncio.wrap_future(future)
+
+
+# Exporters shared by the async functions of each event loop
+_defaultExporters = weakref.WeakKeyDictionary()
+
+
+def _getExporter(exporter):
+    # Return the given exporter or the one shared in the running loop
+    if exporter is not None:
+        return exporter
+    loop = asyncio.get_running_loop()
+    if loop not in _defaultExporters:
+        _defaultExporters[loop] = VtkAsyncExporter()
+    return _defaultExporters[loop]
+
+
+def _asyncExport(func):
+    # Build the awaitable counterpart of an export function
+    async def export(*args, exporter=None, **kwargs):
+        return await _getExporter(exporter).submit(func, *args, **kwargs)
+
+    export.__name__ = export.__qualname__ = func.__name__ + "Async"
+    export.__doc__ = """
+    Awaitable %s.
+
+    Takes the same arguments, and optionally the VtkAsyncExporter
+    that writes the file as exporter. By default, a shared exporter
+    writes at most 4 files at a time.
+    """ % func.__name__
+    return export
+
+
+imageToVTKAsync = _asyncExport(imageToVTK)
+gridToVTKAsync = _asyncExport(gridToVTK)
+pointsToVTKAsync = _asyncExport(pointsToVTK)
+linesToVTKAsync = _asyncExport(linesToVTK)
+polyLinesToVTKAsync = _asyncExport(polyLinesToVTK)
+unstructuredGridToVTKAsync = _asyncExport(unstructuredGridToVTK)
+cylinderToVTKAsync = _asyncExport(cylinderToVTK)
+
+
+class VtkAsyncGroup:
+    """
+    VtkGroup whose files are exported and saved without blocking.
+
+    Parameters
+    ----------
+    filepath : str or file-like
+        filename without extension, see VtkGroup.
+    exporter : VtkAsyncExporter, optional
+        exporter of the files of the group.
+        The default is None, which uses the shared exporter.
+    """
+
+    def __init__(self, filepath, exporter=None):
+        self.group = VtkGroup(filepath)
+        self.exporter = exporter
+
+    def addFile(self, filepath, sim_time, group="", part="0", name=""):
+        """Add a file to this group, see VtkGroup.addFile."""
+        self.group.addFile(filepath, sim_time, group=group, part=part, name=name)
+
+    async def export(self, func, *args, sim_time, group="", part="0", **kwargs):
+        """
+        Export a file and add it to this group.
+
+        Parameters
+        ----------
+        func : callable
+            export function, e.g. imageToVTK.
+        *args, **kwargs
+            arguments of func.
+        sim_time : float
+            time of the file in the group.
+        group, part : str, optional
+            see VtkGroup.addFile.
+
+        Returns
+        -------
+        str
+            Full path to the saved file.
+        """
+        path = await _getExporter(self.exporter).submit(func, *args, **kwargs)
+        self.addFile(path, sim_time, group=group, part=part)
+        return path
+
+    async def save(self):
+        """Write this group without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        executor = _getExporter(self.exporter).executor
+        await loop.run_in_executor(executor, self.group.save)
+
+
+# ================================
+#        Batch export
+# ================================
+def _runJobs(func, loader, jobs):
+    # Export a chunk of jobs in a worker process,
+    # returning the result and the time of each file
+    results = []
+    for job in jobs:
+        if loader is not None:
+            job = loader(job)
+        path, kwargs = job[0], job[1]
+        sim_time = job[2] if len(job) > 2 else None
+        results.append((func(path, **kwargs), sim_time))
+    return results
+
+
+def exportBatch(func, jobs, loader=None, group=None, workers=None, chunksize=1):
+    """
+    Export many files with a pool of processes.
+
+    Parameters
+    ----------
+    func : callable
+        export function, e.g. gridToVTK.
+        It must be importable by the worker processes.
+    jobs : iterable
+        (path, kwargs) or (path, kwargs, sim_time) of each file,
+        where kwargs are the keyword arguments of func.
+        With a loader, any picklable description of the files,
+        e.g. the names of saved .npz snapshots.
+    loader : callable, optional
+        function called in the worker processes with each job,
+        which returns (path, kwargs) or (path, kwargs, sim_time).
+        It must be importable by the worker processes.
+        The default is None, which uses the jobs as they are.
+    group : str or file-like, optional
+        VtkGroup, without extension, to which the files are added
+        as they are exported, with their sim_time or their index in jobs.
+        The default is None, which writes no group.
+    workers : int, optional
+        Number of processes. The default is None, which uses all cores.
+    chunksize : int, optional
+        Number of jobs sent to a process at once. Larger chunks
+        reduce the overhead of many small files. The default is 1.
+
+    Returns
+    -------
+    list
+        The values returned by func, e.g. the paths of the saved files,
+        in the order of jobs.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    jobs = iter(jobs)
+    chunks = iter(lambda: list(itertools.islice(jobs, chunksize)), [])
+    g = None if group is None else VtkGroup(group)
+    results = []
+
+    def collect(future):
+        for result, sim_time in future.result():
+            if g is not None:
+                g.addFile(result, len(results) if sim_time is None else sim_time)
+            results.append(result)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # chunks are collected in order and at most 2 * workers are pending,
+        # which bounds the memory used by the jobs
+        pending = deque()
+        for chunk in chunks:
+            while len(pending) >= 2 * workers:
+                collect(pending.popleft())
+            pending.append(executor.submit(_runJobs, func, loader, chunk))
+        while pending:
+            collect(pending.popleft())
+    if g is not None:
+        g.save()
+    return results
+
+
+# ================================
+#        ProcessComm class
+# ================================
+class ProcessComm:
+    """
+    Communicator of a group of processes started with multiprocessing.
+
+    Implements the subset of the mpi4py communicator API used by
+    the collective functions of pyevtk.hl, e.g. sharedImageToVTK,
+    so they can be called without MPI. Messages are exchanged through
+    one queue per process. Use create to make the communicators
+    of all the processes and pass one to each of them.
+
+    Parameters
+    ----------
+    rank : int
+        rank of this process.
+    queues : list
+        queue of each process.
+    context : tuple, optional
+        identifies the messages of a communicator made by Split
+        among those of the other communicators of the same processes.
+        The default is ().
+    pending : dict, optional
+        messages received ahead of their operation, shared by
+        the communicators of this process. The default is None.
+    """
+
+    def __init__(self, rank, queues, context=(), pending=None):
+        self.rank = rank
+        self.queues = queues
+        self.context = context
+        self.seq = 0  # number of the current collective operation
+        self.pending = {} if pending is None else pending
+
+    @classmethod
+    def create(cls, size, context=None):
+        """
+        Create the communicators of a group of processes.
+
+        Parameters
+        ----------
+        size : int
+            number of processes.
+        context : optional
+            multiprocessing context that makes the queues.
+            The queues of a multiprocessing.Manager can also be
+            sent to the workers of a pool.
+            The default is None, which uses the default context.
+
+        Returns
+        -------
+        list
+            The communicator of each rank.
+            Keep it until the processes are joined, since started
+            processes do not keep a reference to their arguments.
+        """
+        if context is None:
+            context = multiprocessing
+        queues = [context.Queue() for _ in range(size)]
+        return [cls(rank, queues) for rank in range(size)]
+
+    def Get_rank(self):
+        """Return the rank of this process."""
+        return self.rank
+
+    def Get_size(self):
+        """Return the number of processes."""
+        return len(self.queues)
+
+    def _send(self, obj, dest):
+        self.queues[dest].put((self.context, self.seq, self.rank, obj))
+
+    def _recv(self, source):
+        key = (self.context, self.seq, source)
+        while key not in self.pending:
+            context, seq, rank, obj = self.queues[self.rank].get()
+            self.pending[context, seq, rank] = obj
+        return self.pending.pop(key)
+
+    def gather(self, sendobj, root=0):
+        """Return the objects of all the ranks on root, None elsewhere."""
+        if self.rank == root:
+            size = self.Get_size()
+            result = [sendobj if r == root else self._recv(r) for r in range(size)]
+        else:
+            self._send(sendobj, root)
+            result = None
+        self.seq += 1
+        return result
+
+    def scatter(self, sendobj, root=0):
+        """Return the item of the list of root that goes to this rank."""
+        if self.rank == root:
+            for r, obj in enumerate(sendobj):
+                if r != root:
+                    self._send(obj, r)
+            result = sendobj[root]
+        else:
+            result = self._recv(root)
+        self.seq += 1
+        return result
+
+    def bcast(self, obj, root=0):
+        """Return the object of root on all the ranks."""
+        if self.rank == root:
+            for r in range(self.Get_size()):
+                if r != root:
+                    self._send(obj, r)
+        else:
+            obj = self._recv(root)
+        self.seq += 1
+        return obj
+
+    def exscan(self, sendobj):
+        """Return the sum of the objects of the lower ranks, None on rank 0."""
+        values = self.gather(sendobj)
+        if values is not None:
+            values = [None] + list(itertools.accumulate(values[:-1]))
+        return self.scatter(values)
+
+    def Barrier(self):
+        """Wait for all the ranks."""
+        self.bcast(self.gather(None))
+
+    def Split(self, color=0, key=0):
+        """
+        Split the ranks in groups that have the same color.
+
+        Parameters
+        ----------
+        color : int, optional
+            group of this rank. The default is 0.
+        key : int, optional
+            orders the ranks of a group, ties are broken by their
+            rank in this communicator. The default is 0.
+
+        Returns
+        -------
+        ProcessComm
+            The communicator of the group of this rank.
+        """
+        ranks = self.bcast(self.gather((color, key)))
+        members = sorted((k, r) for r, (c, k) in enumerate(ranks) if c == color)
+        members = [r for _, r in members]
+        return ProcessComm(
+            members.index(self.rank),
+            [self.queues[r] for r in members],
+            self.context + ((self.seq, color),),
+            self.pending,
+        )
+
+    def Free(self):
+        """Release this communicator, which holds no resources."""
@@ -21,9 +21,40 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 ######################################################################################
-"""High level Python library to export data to binary VTK file."""
+"""
+High level Python library to export data to binary VTK file.
+
+The functions that write a single file, e.g. imageToVTK, accept
+the following options in addition to those of VtkFile.
+
+precision : str or int or dict, optional
+    lossy precision policy for floating point cell and point data.
+    "float32" stores float64 arrays as float32.
+    An integer keeps that many significant mantissa bits,
+    rounding to nearest and zeroing the others, which makes
+    the data compress much better; float64 arrays are also
+    stored as float32 if at most 23 bits are kept and
+    their values are in the normal range of float32.
+    A dictionary gives the policy of individual arrays by name.
+    The default is None, which stores the data unchanged.
+precisionErrors : dict, optional
+    if given, filled with the errors due to precision,
+    with keys "max_abs_error" (measured) and
+    "max_rel_error" (guaranteed bound) for each reduced array.
+templates : dict, optional
+    cache of file headers. Pass the same dictionary to repeated calls
+    with arrays of the same names, types and shapes,
+    e.g. in a time loop, and the header is built only once.
+    Ignored with compression.
+    The default is None, which builds the header of every file.
+"""
+
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
+from .evtk import roundMantissa
 from .vtk import (
     VtkFile,
     VtkParallelFile,
@@ -32,20 +63,25 @@ from .vtk import (
     VtkRectilinearGrid,
     VtkStructuredGrid,
     VtkPImageData,
+    VtkPPolyData,
     VtkPRectilinearGrid,
     VtkPStructuredGrid,
+    VtkPUnstructuredGrid,
     VtkUnstructuredGrid,
     VtkVertex,
     VtkLine,
     VtkPolyLine,
     VtkPixel,
+    np_to_vtk,
+    planPieces,
+    writeAppendedArrays,
 )
 
 
 # =================================
 #       Helper functions
 # =================================
-def _addDataToFile(vtkFile, cellData, pointData, fieldData=None):
+def _addDataToFile(vtkFile, cellData, pointData, fieldData=None, order="F"):
     # Point data
     if pointData:
         keys = list(pointData.keys())
@@ -57,7 +93,7 @@ def _addDataToFile(vtkFile, cellData, pointData, fieldData=None):
         vtkFile.openData("Point", scalars=scalars, vectors=vectors)
         for key in keys:
             data = pointData[key]
-            vtkFile.addData(key, data)
+            vtkFile.addData(key, data, order=order)
         vtkFile.closeData("Point")
 
     # Cell data
@@ -71,7 +107,7 @@ def _addDataToFile(vtkFile, cellData, pointData, fieldData=None):
         vtkFile.openData("Cell", scalars=scalars, vectors=vectors)
         for key in keys:
             data = cellData[key]
-            vtkFile.addData(key, data)
+            vtkFile.addData(key, data, order=order)
         vtkFile.closeData("Cell")
 
     # Field data
@@ -112,19 +148,149 @@ def _addDataToParallelFile(vtkParallelFile, cellData, pointData):
         vtkParallelFile.closeData("PCell")
 
 
-def _appendDataToFile(vtkFile, cellData, pointData, fieldData=None):
+def _describeData(data):
+    # Types and number of components of the arrays of a parallel file,
+    # given as (dtype, ncomp) or by the arrays of a representative piece
+    if data is None:
+        return None
+    described = {}
+    for key, value in data.items():
+        if isinstance(value, np.ndarray):
+            described[key] = (value.dtype, 1)
+        elif len(value) == 2 and isinstance(value[1], (int, np.integer)):
+            described[key] = (np.dtype(value[0]), int(value[1]))
+        else:
+            described[key] = (value[0].dtype, len(value))
+    return described
+
+
+def _describePiece(filename):
+    # Types and number of components of the point data, cell data,
+    # points and coordinates, and the extent of the first piece
+    # of a VTK XML file, read from its header
+    header = b""
+    with open(filename, "rb") as f:
+        while b"<AppendedData" not in header:
+            chunk = f.read(64 * 1024)
+            if not chunk:
+                break
+            header += chunk
+    header = header.split(b"<AppendedData")[0].decode("latin-1")
+    vtk_to_np = {t.name: name for name, t in np_to_vtk.items()}
+    sections = {}
+    for section in ("PointData", "CellData", "Points", "Coordinates"):
+        m = re.search(r"<%s\b[^>]*>(.*?)</%s>" % (section, section), header, re.S)
+        arrays = {}
+        for tag in re.findall(r"<DataArray\b[^>]*>", m.group(1) if m else ""):
+            attrs = dict(re.findall(r'(\w+)="([^"]*)"', tag))
+            dtype = np.dtype(vtk_to_np[attrs["type"]])
+            arrays[attrs["Name"]] = (dtype, int(attrs.get("NumberOfComponents", 1)))
+        sections[section] = arrays
+    m = re.search(r'<Piece\b[^>]*\bExtent="([^"]*)"', header)
+    sections["Extent"] = tuple(int(v) for v in m.group(1).split()) if m else None
+    return sections
+
+
+def _reducePrecision(data, precision, errors=None):
+    # Apply a precision policy to a dictionary of scalar or vector arrays
+    if data is None or precision is None:
+        return data
+    reduced = {}
+    for key, value in data.items():
+        policy = precision.get(key) if isinstance(precision, dict) else precision
+        if policy is None:
+            reduced[key] = value
+            continue
+        components = value if isinstance(value, tuple) else (value,)
+        new, abs_error, rel_error = [], 0.0, 0.0
+        for a in components:
+            b, rel = _reduceArrayPrecision(a, policy)
+            if b is not a:
+                diff = np.abs(b.astype("float64") - a)
+                abs_error = max(abs_error, float(np.max(diff, initial=0.0)))
+            rel_error = max(rel_error, rel)
+            new.append(b)
+        reduced[key] = tuple(new) if isinstance(value, tuple) else new[0]
+        if errors is not None:
+            errors[key] = {"max_abs_error": abs_error, "max_rel_error": rel_error}
+    return reduced
+
+
+def _reduceArrayPrecision(a, policy):
+    # Return the reduced array and the bound on its relative error
+    if a.dtype.kind != "f":
+        return a, 0.0
+    if policy == "float32":
+        keepbits = np.finfo("float32").nmant
+    else:
+        keepbits = int(policy)
+    rel_error = 0.0
+    if keepbits < np.finfo(a.dtype).nmant:
+        a = roundMantissa(a, keepbits)
+        rel_error = 2.0 ** -(keepbits + 1)
+    if (
+        a.dtype == np.float64
+        and keepbits <= np.finfo("float32").nmant
+        and _isFloat32Range(a)
+    ):
+        # exact, as the mantissa fits in a float32
+        order = "F" if a.flags["F_CONTIGUOUS"] else "C"
+        a = a.astype("float32", order=order)
+        rel_error = max(rel_error, 2.0**-24)
+    return a, rel_error
+
+
+def _isFloat32Range(a):
+    # Whether the finite non-zero values of a are normal float32 numbers,
+    # which are cast without overflow or loss of precision
+    info = np.finfo("float32")
+    m = np.abs(a)
+    m = m[np.isfinite(m) & (m != 0)]
+    return m.size == 0 or (m.max() <= info.max and m.min() >= info.tiny)
+
+
+def _layoutKey(*args):
+    # Describe the arguments that determine the header of a file
+    # as a hashable key, arrays by their type and shape only
+    key = []
+    for a in args:
+        if isinstance(a, np.ndarray):
+            key.append((a.dtype.str, a.shape))
+        elif isinstance(a, dict):
+            key.append(tuple((k, _layoutKey(v)) for k, v in a.items()))
+        elif isinstance(a, (tuple, list)):
+            key.append(_layoutKey(*a))
+        else:
+            key.append(a)
+    return tuple(key)
+
+
+def _getTemplate(templates, key, compression):
+    # Return the cached layout of files with this key, if any
+    if templates is None or compression:
+        return None
+    return templates.get(key)
+
+
+def _setTemplate(templates, key, vtkFile):
+    # Cache the layout of an uncompressed file once its header is complete
+    if templates is not None and not vtkFile.compressor:
+        templates[key] = vtkFile.getLayout()
+
+
+def _appendDataToFile(vtkFile, cellData, pointData, fieldData=None, order="F"):
     # Append data to binary section
     if pointData is not None:
         keys = list(pointData.keys())
         for key in keys:
             data = pointData[key]
-            vtkFile.appendData(data)
+            vtkFile.appendData(data, order=order)
 
     if cellData is not None:
         keys = list(cellData.keys())
         for key in keys:
             data = cellData[key]
-            vtkFile.appendData(data)
+            vtkFile.appendData(data, order=order)
 
     if fieldData is not None:
         keys = list(fieldData.keys())
@@ -136,6 +302,41 @@ def _appendDataToFile(vtkFile, cellData, pointData, fieldData=None):
 # =================================
 #       High level functions
 # =================================
+def _imageEnd(start, spacing, cellData, pointData, order):
+    # Last point of an image piece, from the shape of its data
+    end = None
+    if cellData is not None:
+        keys = list(cellData.keys())
+        data = cellData[keys[0]]
+        if hasattr(data, "shape"):
+            end = data.shape
+        elif data[0].ndim == 3 and data[1].ndim == 3 and data[2].ndim == 3:
+            end = data[0].shape
+        if order == "C":
+            end = end[::-1]
+        end = tuple(s + e for s, e in zip(start, end))
+        for i, s in enumerate(spacing):
+            if np.isclose(s, 0.0):
+                if end[i] - start[i] == 1:
+                    end = end[:i] + (start[i],) + end[i + 1 :]
+                else:
+                    raise ValueError("imageToVTK: grid has lower dimension than data")
+    elif pointData is not None:
+        keys = list(pointData.keys())
+        data = pointData[keys[0]]
+        if hasattr(data, "shape"):
+            end = data.shape
+        elif data[0].ndim == 3 and data[1].ndim == 3 and data[2].ndim == 3:
+            end = data[0].shape
+        if order == "C":
+            end = end[::-1]
+        end = tuple(s + e - 1 for s, e in zip(start, end))
+        for i, s in enumerate(spacing):
+            if np.isclose(s, 0.0) and end[i] > start[i]:
+                raise ValueError("imageToVTK: grid has lower dimension than data")
+    return end
+
+
 def imageToVTK(
     path,
     origin=(0.0, 0.0, 0.0),
@@ -144,14 +345,24 @@ def imageToVTK(
     pointData=None,
     fieldData=None,
     start=(0, 0, 0),
+    order="F",
+    workers=None,
+    compression=None,
+    compressionWorkers=None,
+    writeWorkers=None,
+    gatherWrites=False,
+    precision=None,
+    precisionErrors=None,
+    templates=None,
 ):
     """
     Export data values as a rectangular image.
 
     Parameters
     ----------
-    path : str
-        name of the file without extension where data should be saved.
+    path : str or file-like
+        name of the file without extension where data should be saved,
+        or a binary file object to write to, e.g. an io.BytesIO.
     start : tuple, optional
         start of the coordinates.
         Used in the distributed context where each process
@@ -179,69 +390,105 @@ def imageToVTK(
     fieldData : dict, optional
         dictionary with variables associated with the field.
         Keys should be the names of the variable stored in each array.
+    order : {"F", "C"}, optional
+        index order of the data arrays.
+        "F" means arrays are indexed as [x, y, z],
+        "C" means they are indexed as [z, y, x], i.e. have shape (nz, ny, nx).
+        C contiguous arrays indexed as [z, y, x] are written
+        without a transposed copy.
+        origin, spacing and start are always given as (x, y, z).
+        The default is "F".
+    workers, compression, compressionWorkers, writeWorkers, gatherWrites : optional
+        options of the writer, see VtkFile.
+    precision, precisionErrors, templates : optional
+        lossy precision and header cache, see the module docstring.
 
     Returns
     -------
     str
-        Full path to saved file.
+        Full path to saved file, or None if path is a file object.
 
     Notes
     -----
     At least, cellData or pointData must be present
     to infer the dimensions of the image.
     """
+    cellData = _reducePrecision(cellData, precision, precisionErrors)
+    pointData = _reducePrecision(pointData, precision, precisionErrors)
     assert cellData is not None or pointData is not None
 
-    # Extract dimensions
-    end = None
-    if cellData is not None:
-        keys = list(cellData.keys())
-        data = cellData[keys[0]]
-        if hasattr(data, "shape"):
-            end = data.shape
-        elif data[0].ndim == 3 and data[1].ndim == 3 and data[2].ndim == 3:
-            end = data[0].shape
-        for i, s in enumerate(spacing):
-            if np.isclose(s, 0.0):
-                if end[i] == 1:
-                    end = end[:i] + (0,) + end[i + 1 :]
-                else:
-                    raise ValueError("imageToVTK: grid has lower dimension than data")
-    elif pointData is not None:
-        keys = list(pointData.keys())
-        data = pointData[keys[0]]
-        if hasattr(data, "shape"):
-            end = data.shape
-        elif data[0].ndim == 3 and data[1].ndim == 3 and data[2].ndim == 3:
-            end = data[0].shape
-        end = (end[0] - 1, end[1] - 1, end[2] - 1)
-        for i, s in enumerate(spacing):
-            if np.isclose(s, 0.0) and end[i] > 0:
-                raise ValueError("imageToVTK: grid has lower dimension than data")
+    end = _imageEnd(start, spacing, cellData, pointData, order)
 
     # Write data to file
-    w = VtkFile(path, VtkImageData)
-    w.openGrid(start=start, end=end, origin=origin, spacing=spacing)
-    w.openPiece(start=start, end=end)
-    _addDataToFile(w, cellData, pointData, fieldData)
-    w.closePiece()
-    w.closeGrid()
-    _appendDataToFile(w, cellData, pointData, fieldData)
+    key = _layoutKey(
+        "imageToVTK", origin, spacing, start, order, cellData, pointData, fieldData
+    )
+    template = _getTemplate(templates, key, compression)
+    w = VtkFile(
+        path,
+        VtkImageData,
+        workers=workers,
+        compression=compression,
+        compressionWorkers=compressionWorkers,
+        template=template,
+        writeWorkers=writeWorkers,
+        gatherWrites=gatherWrites,
+    )
+    if template is None:
+        w.openGrid(start=start, end=end, origin=origin, spacing=spacing)
+        w.openPiece(start=start, end=end)
+        _addDataToFile(w, cellData, pointData, fieldData, order=order)
+        w.closePiece()
+        w.closeGrid()
+        _setTemplate(templates, key, w)
+    _appendDataToFile(w, cellData, pointData, fieldData, order=order)
     w.save()
     return w.getFileName()
 
 
 # ==============================================================================
+def _gridEnd(x, y, z, start, order):
+    # Last point of a rectilinear or structured grid piece
+    if x.ndim == 1 and y.ndim == 1 and z.ndim == 1:
+        nx, ny, nz = x.size - 1, y.size - 1, z.size - 1
+    elif x.ndim == 3 and y.ndim == 3 and z.ndim == 3:
+        s = x.shape if order == "F" else x.shape[::-1]
+        nx, ny, nz = s[0] - 1, s[1] - 1, s[2] - 1
+    else:
+        raise ValueError(
+            f"x, y and z should have ndim == 3 but they have ndim of {x.ndim}, {y.ndim}"
+            f" and {z.ndim} respectively"
+        )
+    return (start[0] + nx, start[1] + ny, start[2] + nz)
+
+
 def gridToVTK(
-    path, x, y, z, cellData=None, pointData=None, fieldData=None, start=(0, 0, 0)
+    path,
+    x,
+    y,
+    z,
+    cellData=None,
+    pointData=None,
+    fieldData=None,
+    start=(0, 0, 0),
+    order="F",
+    workers=None,
+    compression=None,
+    compressionWorkers=None,
+    writeWorkers=None,
+    gatherWrites=False,
+    precision=None,
+    precisionErrors=None,
+    templates=None,
 ):
     """
     Write data values as a rectilinear or structured grid.
 
     Parameters
     ----------
-    path : str
-        name of the file without extension where data should be saved.
+    path : str or file-like
+        name of the file without extension where data should be saved,
+        or a binary file object to write to, e.g. an io.BytesIO.
     x : array-like
         x coordinate axis.
     y : array-like
@@ -266,10 +513,22 @@ def gridToVTK(
     fieldData : dict, optional
         dictionary with variables associated with the field.
         Keys should be the names of the variable stored in each array.
+    order : {"F", "C"}, optional
+        index order of the 3D coordinate and data arrays.
+        "F" means arrays are indexed as [i, j, k],
+        "C" means they are indexed as [k, j, i], i.e. have shape (nz, ny, nx).
+        C contiguous arrays indexed as [k, j, i] are written
+        without a transposed copy.
+        1D coordinate arrays and start are not affected.
+        The default is "F".
+    workers, compression, compressionWorkers, writeWorkers, gatherWrites : optional
+        options of the writer, see VtkFile.
+    precision, precisionErrors, templates : optional
+        lossy precision and header cache, see the module docstring.
     Returns
     -------
     str
-        Full path to saved file.
+        Full path to saved file, or None if path is a file object.
     Notes
     -----
     coordinates of the nodes of the grid. They can be 1D or 3D depending if
@@ -283,59 +542,60 @@ def gridToVTK(
     In both cases the arrays dimensions should be
     equal to the number of nodes of the grid.
     """
-    nx = ny = nz = 0
-
-    if x.ndim == 1 and y.ndim == 1 and z.ndim == 1:
-        nx, ny, nz = x.size - 1, y.size - 1, z.size - 1
-        isRect = True
-        ftype = VtkRectilinearGrid
-    elif x.ndim == 3 and y.ndim == 3 and z.ndim == 3:
-        s = x.shape
-        nx, ny, nz = s[0] - 1, s[1] - 1, s[2] - 1
-        isRect = False
-        ftype = VtkStructuredGrid
-    else:
-        raise ValueError(
-            f"x, y and z should have ndim == 3 but they have ndim of {x.ndim}, {y.ndim}"
-            f" and {z.ndim} respectively"
-        )
+    cellData = _reducePrecision(cellData, precision, precisionErrors)
+    pointData = _reducePrecision(pointData, precision, precisionErrors)
+    isRect = x.ndim == 1
+    ftype = VtkRectilinearGrid if isRect else VtkStructuredGrid
 
     # Write extent
-    end = (start[0] + nx, start[1] + ny, start[2] + nz)
+    end = _gridEnd(x, y, z, start, order)
 
     # Open File
-    w = VtkFile(path, ftype)
-
-    # Open Grid part
-    w.openGrid(start=start, end=end)
-    w.openPiece(start=start, end=end)
-
-    # Add coordinates description
-    if isRect:
-        w.openElement("Coordinates")
-        w.addData("x_coordinates", x)
-        w.addData("y_coordinates", y)
-        w.addData("z_coordinates", z)
-        w.closeElement("Coordinates")
-    else:
-        w.openElement("Points")
-        w.addData("points", (x, y, z))
-        w.closeElement("Points")
-
-    # Add data description
-    _addDataToFile(w, cellData, pointData, fieldData)
+    key = _layoutKey("gridToVTK", x, y, z, start, order, cellData, pointData, fieldData)
+    template = _getTemplate(templates, key, compression)
+    w = VtkFile(
+        path,
+        ftype,
+        workers=workers,
+        compression=compression,
+        compressionWorkers=compressionWorkers,
+        template=template,
+        writeWorkers=writeWorkers,
+        gatherWrites=gatherWrites,
+    )
 
-    # Close Grid part
-    w.closePiece()
-    w.closeGrid()
+    if template is None:
+        # Open Grid part
+        w.openGrid(start=start, end=end)
+        w.openPiece(start=start, end=end)
+
+        # Add coordinates description
+        if isRect:
+            w.openElement("Coordinates")
+            w.addData("x_coordinates", x)
+            w.addData("y_coordinates", y)
+            w.addData("z_coordinates", z)
+            w.closeElement("Coordinates")
+        else:
+            w.openElement("Points")
+            w.addData("points", (x, y, z), order=order)
+            w.closeElement("Points")
+
+        # Add data description
+        _addDataToFile(w, cellData, pointData, fieldData, order=order)
+
+        # Close Grid part
+        w.closePiece()
+        w.closeGrid()
+        _setTemplate(templates, key, w)
 
     # Write coordinates
     if isRect:
         w.appendData(x).appendData(y).appendData(z)
     else:
-        w.appendData((x, y, z))
+        w.appendData((x, y, z), order=order)
     # Write data
-    _appendDataToFile(w, cellData, pointData, fieldData)
+    _appendDataToFile(w, cellData, pointData, fieldData, order=order)
 
     # Close file
     w.save()
@@ -344,23 +604,32 @@ def gridToVTK(
 
 
 def writeParallelVTKGrid(
-    path, coordsData, starts, ends, sources, ghostlevel=0, cellData=None, pointData=None
+    path,
+    coordsData,
+    starts,
+    ends,
+    sources,
+    ghostlevel=0,
+    cellData=None,
+    pointData=None,
+    origin=None,
+    spacing=None,
 ):
     """
     Writes a parallel vtk file from grid-like data:
-    VTKStructuredGrid or VTKRectilinearGrid
+    VTKStructuredGrid, VTKRectilinearGrid or VTKImageData
 
     Parameters
     ----------
-    path : str
-        name of the file without extension.
+    path : str or file-like
+        name of the file without extension, or a binary file object.
     coordsData : tuple
         2-tuple (shape, dtype) where shape is the
         shape of the coordinates of the full mesh
         and dtype is the dtype of the coordinates.
     starts : list
         list of 3-tuple representing where each source file starts
-        in each dimension
+        in each dimension. The full mesh starts at their minimum.
     source : list
         list of the relative paths of the source files where the actual data is found
     ghostlevel : int, optional
@@ -376,6 +645,10 @@ def writeParallelVTKGrid(
         containing cell centered data.
         Keys shoud be the names of the arrays.
         Values are (dtype, number of components)
+    origin : tuple, optional
+        grid origin of VTKImageData sources.
+    spacing : tuple, optional
+        grid spacing of VTKImageData sources.
     """
     # Check that every source as a start and an end
     assert len(starts) == len(ends) == len(sources)
@@ -386,29 +659,32 @@ def writeParallelVTKGrid(
 
     if common_ext == "vts":
         ftype = VtkPStructuredGrid
-        is_Rect = False
     elif common_ext == "vtr":
         ftype = VtkPRectilinearGrid
-        is_Rect = True
+    elif common_ext == "vti":
+        ftype = VtkPImageData
     else:
-        raise ValueError("This functions is meant to work only with ")
+        raise ValueError("This functions is meant to work only with vts, vtr or vti.")
 
     w = VtkParallelFile(path, ftype)
-    start = (0, 0, 0)
-    (s_x, s_y, s_z), dtype = coordsData
-    end = s_x - 1, s_y - 1, s_z - 1
+    # the whole extent starts where the first pieces start
+    start = tuple(min(s[i] for s in starts) for i in range(3))
+    shape, dtype = coordsData
+    end = tuple(s + n - 1 for s, n in zip(start, shape))
 
-    w.openGrid(start=start, end=end, ghostlevel=ghostlevel)
+    w.openGrid(
+        start=start, end=end, origin=origin, spacing=spacing, ghostlevel=ghostlevel
+    )
 
     _addDataToParallelFile(w, cellData=cellData, pointData=pointData)
 
-    if is_Rect:
+    if ftype == VtkPRectilinearGrid:
         w.openElement("PCoordinates")
         w.addHeader("x_coordinates", dtype=dtype, ncomp=1)
         w.addHeader("y_coordinates", dtype=dtype, ncomp=1)
         w.addHeader("z_coordinates", dtype=dtype, ncomp=1)
         w.closeElement("PCoordinates")
-    else:
+    elif ftype == VtkPStructuredGrid:
         w.openElement("PPoints")
         w.addHeader("points", dtype=dtype, ncomp=3)
         w.closeElement("PPoints")
@@ -421,15 +697,191 @@ def writeParallelVTKGrid(
     return w.getFileName()
 
 
+def _pieceData(path, sources, cellData, pointData):
+    # Describe the data of a parallel file, reading the first source if needed
+    if cellData is None and pointData is None:
+        root = os.path.dirname(path) if isinstance(path, str) else os.curdir
+        piece = _describePiece(os.path.join(root, sources[0]))
+        return piece["CellData"] or None, piece["PointData"] or None, piece
+    return _describeData(cellData), _describeData(pointData), None
+
+
+def writeParallelVTKImage(
+    path,
+    starts,
+    ends,
+    sources,
+    origin=(0.0, 0.0, 0.0),
+    spacing=(1.0, 1.0, 1.0),
+    ghostlevel=0,
+    cellData=None,
+    pointData=None,
+):
+    """
+    Writes a parallel vtk file from image data pieces (.pvti).
+
+    Parameters
+    ----------
+    path : str or file-like
+        name of the file without extension, or a binary file object.
+    starts : list
+        list of 3-tuple representing where each source file starts
+        in each dimension
+    ends : list
+        list of 3-tuple representing where each source file ends
+        in each dimension
+    sources : list
+        list of the relative paths of the source files where the actual data is found
+    origin : tuple, optional
+        grid origin. The default is (0.0, 0.0, 0.0).
+    spacing : tuple, optional
+        grid spacing. The default is (1.0, 1.0, 1.0).
+    ghostlevel : int, optional
+        Number of ghost-levels by which
+        the extents in the individual source files overlap.
+    cellData, pointData : dict, optional
+        arrays of a representative piece, or (dtype, number of components)
+        of each array, by name.
+        If both are None, they are read from the first source.
+    """
+    cellData, pointData, _ = _pieceData(path, sources, cellData, pointData)
+    shape = tuple(
+        max(end[i] for end in ends) - min(start[i] for start in starts) + 1
+        for i in range(3)
+    )
+    return writeParallelVTKGrid(
+        path,
+        coordsData=(shape, None),
+        starts=starts,
+        ends=ends,
+        sources=sources,
+        ghostlevel=ghostlevel,
+        cellData=cellData,
+        pointData=pointData,
+        origin=origin,
+        spacing=spacing,
+    )
+
+
+def _writeParallelPieces(
+    path, ftype, sources, ghostlevel, cellData, pointData, pointsType
+):
+    # Write the index of unstructured pieces, which have no extents
+    cellData, pointData, piece = _pieceData(path, sources, cellData, pointData)
+    if pointsType is None:
+        if piece is None:
+            root = os.path.dirname(path) if isinstance(path, str) else os.curdir
+            piece = _describePiece(os.path.join(root, sources[0]))
+        (pointsType, _), *_ = piece["Points"].values()
+
+    w = VtkParallelFile(path, ftype)
+    w.openGrid(ghostlevel=ghostlevel)
+    _addDataToParallelFile(w, cellData=cellData, pointData=pointData)
+    w.openElement("PPoints")
+    w.addHeader("points", dtype=np.dtype(pointsType), ncomp=3)
+    w.closeElement("PPoints")
+    for source in sources:
+        w.addPiece(source=source)
+    w.closeGrid()
+    w.save()
+    return w.getFileName()
+
+
+def writeParallelVTKUnstructuredGrid(
+    path, sources, ghostlevel=0, cellData=None, pointData=None, pointsType=None
+):
+    """
+    Writes a parallel vtk file from unstructured grid pieces (.pvtu).
+
+    Parameters
+    ----------
+    path : str or file-like
+        name of the file without extension, or a binary file object.
+    sources : list
+        list of the relative paths of the .vtu source files.
+    ghostlevel : int, optional
+        Number of ghost-levels by which the individual pieces overlap.
+    cellData, pointData : dict, optional
+        arrays of a representative piece, or (dtype, number of components)
+        of each array, by name.
+        If both are None, they are read from the first source.
+    pointsType : str, optional
+        data type of the points, e.g. "float64".
+        The default is None, which reads it from the first source.
+
+    Returns
+    -------
+    str
+        Full path to saved file, or None if path is a file object.
+    """
+    return _writeParallelPieces(
+        path,
+        VtkPUnstructuredGrid,
+        sources,
+        ghostlevel,
+        cellData,
+        pointData,
+        pointsType,
+    )
+
+
+def writeParallelVTKPolyData(
+    path, sources, ghostlevel=0, cellData=None, pointData=None, pointsType=None
+):
+    """
+    Writes a parallel vtk file from poly data pieces (.pvtp).
+
+    Parameters
+    ----------
+    path : str or file-like
+        name of the file without extension, or a binary file object.
+    sources : list
+        list of the relative paths of the .vtp source files.
+    ghostlevel : int, optional
+        Number of ghost-levels by which the individual pieces overlap.
+    cellData, pointData : dict, optional
+        arrays of a representative piece, or (dtype, number of components)
+        of each array, by name.
+        If both are None, they are read from the first source.
+    pointsType : str, optional
+        data type of the points, e.g. "float64".
+        The default is None, which reads it from the first source.
+
+    Returns
+    -------
+    str
+        Full path to saved file, or None if path is a file object.
+    """
+    return _writeParallelPieces(
+        path, VtkPPolyData, sources, ghostlevel, cellData, pointData, pointsType
+    )
+
+
 # ==============================================================================
-def pointsToVTK(path, x, y, z, data=None, fieldData=None):
+def pointsToVTK(
+    path,
+    x,
+    y,
+    z,
+    data=None,
+    fieldData=None,
+    workers=None,
+    compression=None,
+    compressionWorkers=None,
+    writeWorkers=None,
+    gatherWrites=False,
+    precision=None,
+    precisionErrors=None,
+    templates=None,
+):
     """
     Export points and associated data as an unstructured grid.
 
     Parameters
     ----------
-    path : str
-        name of the file without extension where data should be saved.
+    path : str or file-like
+        name of the file without extension where data should be saved,
+        or a binary file object to write to, e.g. an io.BytesIO.
     x : array-like
         x coordinates of the points.
     y : array-like
@@ -443,12 +895,17 @@ def pointsToVTK(path, x, y, z, data=None, fieldData=None):
     fieldData : dict, optional
         dictionary with variables associated with the field.
         Keys should be the names of the variable stored in each array.
+    workers, compression, compressionWorkers, writeWorkers, gatherWrites : optional
+        options of the writer, see VtkFile.
+    precision, precisionErrors, templates : optional
+        lossy precision and header cache, see the module docstring.
 
     Returns
     -------
     str
-        Full path to saved file.
+        Full path to saved file, or None if path is a file object.
     """
+    data = _reducePrecision(data, precision, precisionErrors)
     assert x.size == y.size == z.size
     npoints = x.size
 
@@ -463,23 +920,36 @@ def pointsToVTK(path, x, y, z, data=None, fieldData=None):
 
     cell_types[:] = VtkVertex.tid
 
-    w = VtkFile(path, VtkUnstructuredGrid)
-    w.openGrid()
-    w.openPiece(ncells=npoints, npoints=npoints)
+    key = _layoutKey("pointsToVTK", x, y, z, data, fieldData)
+    template = _getTemplate(templates, key, compression)
+    w = VtkFile(
+        path,
+        VtkUnstructuredGrid,
+        workers=workers,
+        compression=compression,
+        compressionWorkers=compressionWorkers,
+        template=template,
+        writeWorkers=writeWorkers,
+        gatherWrites=gatherWrites,
+    )
+    if template is None:
+        w.openGrid()
+        w.openPiece(ncells=npoints, npoints=npoints)
 
-    w.openElement("Points")
-    w.addData("points", (x, y, z))
-    w.closeElement("Points")
-    w.openElement("Cells")
-    w.addData("connectivity", connectivity)
-    w.addData("offsets", offsets)
-    w.addData("types", cell_types)
-    w.closeElement("Cells")
+        w.openElement("Points")
+        w.addData("points", (x, y, z))
+        w.closeElement("Points")
+        w.openElement("Cells")
+        w.addData("connectivity", connectivity)
+        w.addData("offsets", offsets)
+        w.addData("types", cell_types)
+        w.closeElement("Cells")
 
-    _addDataToFile(w, cellData=None, pointData=data, fieldData=fieldData)
+        _addDataToFile(w, cellData=None, pointData=data, fieldData=fieldData)
 
-    w.closePiece()
-    w.closeGrid()
+        w.closePiece()
+        w.closeGrid()
+        _setTemplate(templates, key, w)
     w.appendData((x, y, z))
     w.appendData(connectivity).appendData(offsets).appendData(cell_types)
 
@@ -490,14 +960,31 @@ def pointsToVTK(path, x, y, z, data=None, fieldData=None):
 
 
 # ==============================================================================
-def linesToVTK(path, x, y, z, cellData=None, pointData=None, fieldData=None):
+def linesToVTK(
+    path,
+    x,
+    y,
+    z,
+    cellData=None,
+    pointData=None,
+    fieldData=None,
+    workers=None,
+    compression=None,
+    compressionWorkers=None,
+    writeWorkers=None,
+    gatherWrites=False,
+    precision=None,
+    precisionErrors=None,
+    templates=None,
+):
     """
     Export line segments that joint 2 points and associated data.
 
     Parameters
     ----------
-    path : str
-        name of the file without extension where data should be saved.
+    path : str or file-like
+        name of the file without extension where data should be saved,
+        or a binary file object to write to, e.g. an io.BytesIO.
     x : array-like
         x coordinates of the points in lines.
     y : array-like
@@ -515,11 +1002,15 @@ def linesToVTK(path, x, y, z, cellData=None, pointData=None, fieldData=None):
     fieldData : dict, optional
         dictionary with variables associated with the field.
         Keys should be the names of the variable stored in each array.
+    workers, compression, compressionWorkers, writeWorkers, gatherWrites : optional
+        options of the writer, see VtkFile.
+    precision, precisionErrors, templates : optional
+        lossy precision and header cache, see the module docstring.
 
     Returns
     -------
     str
-        Full path to saved file.
+        Full path to saved file, or None if path is a file object.
 
     Notes
     -----
@@ -528,6 +1019,8 @@ def linesToVTK(path, x, y, z, cellData=None, pointData=None, fieldData=None):
     is defined by two points,
     then the lenght of the arrays should be equal to 2 * number of lines.
     """
+    cellData = _reducePrecision(cellData, precision, precisionErrors)
+    pointData = _reducePrecision(pointData, precision, precisionErrors)
     assert x.size == y.size == z.size
     assert x.size % 2 == 0
     npoints = x.size
@@ -546,23 +1039,36 @@ def linesToVTK(path, x, y, z, cellData=None, pointData=None, fieldData=None):
 
     cell_types[:] = VtkLine.tid
 
-    w = VtkFile(path, VtkUnstructuredGrid)
-    w.openGrid()
-    w.openPiece(ncells=ncells, npoints=npoints)
+    key = _layoutKey("linesToVTK", x, y, z, cellData, pointData, fieldData)
+    template = _getTemplate(templates, key, compression)
+    w = VtkFile(
+        path,
+        VtkUnstructuredGrid,
+        workers=workers,
+        compression=compression,
+        compressionWorkers=compressionWorkers,
+        template=template,
+        writeWorkers=writeWorkers,
+        gatherWrites=gatherWrites,
+    )
+    if template is None:
+        w.openGrid()
+        w.openPiece(ncells=ncells, npoints=npoints)
 
-    w.openElement("Points")
-    w.addData("points", (x, y, z))
-    w.closeElement("Points")
-    w.openElement("Cells")
-    w.addData("connectivity", connectivity)
-    w.addData("offsets", offsets)
-    w.addData("types", cell_types)
-    w.closeElement("Cells")
+        w.openElement("Points")
+        w.addData("points", (x, y, z))
+        w.closeElement("Points")
+        w.openElement("Cells")
+        w.addData("connectivity", connectivity)
+        w.addData("offsets", offsets)
+        w.addData("types", cell_types)
+        w.closeElement("Cells")
 
-    _addDataToFile(w, cellData=cellData, pointData=pointData, fieldData=fieldData)
+        _addDataToFile(w, cellData=cellData, pointData=pointData, fieldData=fieldData)
 
-    w.closePiece()
-    w.closeGrid()
+        w.closePiece()
+        w.closeGrid()
+        _setTemplate(templates, key, w)
     w.appendData((x, y, z))
     w.appendData(connectivity).appendData(offsets).appendData(cell_types)
 
@@ -574,15 +1080,31 @@ def linesToVTK(path, x, y, z, cellData=None, pointData=None, fieldData=None):
 
 # ==============================================================================
 def polyLinesToVTK(
-    path, x, y, z, pointsPerLine, cellData=None, pointData=None, fieldData=None
+    path,
+    x,
+    y,
+    z,
+    pointsPerLine,
+    cellData=None,
+    pointData=None,
+    fieldData=None,
+    workers=None,
+    compression=None,
+    compressionWorkers=None,
+    writeWorkers=None,
+    gatherWrites=False,
+    precision=None,
+    precisionErrors=None,
+    templates=None,
 ):
     """
     Export line segments that joint n points and associated data.
 
     Parameters
     ----------
-    path : str
-        name of the file without extension where data should be saved.
+    path : str or file-like
+        name of the file without extension where data should be saved,
+        or a binary file object to write to, e.g. an io.BytesIO.
     x : array-like
         x coordinates of the points in lines.
     y : array-like
@@ -602,12 +1124,18 @@ def polyLinesToVTK(
     fieldData : dict, optional
         dictionary with variables associated with the field.
         Keys should be the names of the variable stored in each array.
+    workers, compression, compressionWorkers, writeWorkers, gatherWrites : optional
+        options of the writer, see VtkFile.
+    precision, precisionErrors, templates : optional
+        lossy precision and header cache, see the module docstring.
 
     Returns
     -------
     str
-        Full path to saved file.
+        Full path to saved file, or None if path is a file object.
     """
+    cellData = _reducePrecision(cellData, precision, precisionErrors)
+    pointData = _reducePrecision(pointData, precision, precisionErrors)
     assert x.size == y.size == z.size
     npoints = x.size
     ncells = pointsPerLine.size
@@ -626,23 +1154,38 @@ def polyLinesToVTK(
     cell_types = np.empty(npoints, dtype="uint8")
     cell_types[:] = VtkPolyLine.tid
 
-    w = VtkFile(path, VtkUnstructuredGrid)
-    w.openGrid()
-    w.openPiece(ncells=ncells, npoints=npoints)
+    key = _layoutKey(
+        "polyLinesToVTK", x, y, z, pointsPerLine, cellData, pointData, fieldData
+    )
+    template = _getTemplate(templates, key, compression)
+    w = VtkFile(
+        path,
+        VtkUnstructuredGrid,
+        workers=workers,
+        compression=compression,
+        compressionWorkers=compressionWorkers,
+        template=template,
+        writeWorkers=writeWorkers,
+        gatherWrites=gatherWrites,
+    )
+    if template is None:
+        w.openGrid()
+        w.openPiece(ncells=ncells, npoints=npoints)
 
-    w.openElement("Points")
-    w.addData("points", (x, y, z))
-    w.closeElement("Points")
-    w.openElement("Cells")
-    w.addData("connectivity", connectivity)
-    w.addData("offsets", offsets)
-    w.addData("types", cell_types)
-    w.closeElement("Cells")
+        w.openElement("Points")
+        w.addData("points", (x, y, z))
+        w.closeElement("Points")
+        w.openElement("Cells")
+        w.addData("connectivity", connectivity)
+        w.addData("offsets", offsets)
+        w.addData("types", cell_types)
+        w.closeElement("Cells")
 
-    _addDataToFile(w, cellData=cellData, pointData=pointData, fieldData=fieldData)
+        _addDataToFile(w, cellData=cellData, pointData=pointData, fieldData=fieldData)
 
-    w.closePiece()
-    w.closeGrid()
+        w.closePiece()
+        w.closeGrid()
+        _setTemplate(templates, key, w)
     w.appendData((x, y, z))
     w.appendData(connectivity).appendData(offsets).appendData(cell_types)
 
@@ -664,14 +1207,23 @@ def unstructuredGridToVTK(
     cellData=None,
     pointData=None,
     fieldData=None,
+    workers=None,
+    compression=None,
+    compressionWorkers=None,
+    writeWorkers=None,
+    gatherWrites=False,
+    precision=None,
+    precisionErrors=None,
+    templates=None,
 ):
     """
     Export unstructured grid and associated data.
 
     Parameters
     ----------
-    path : str
-        name of the file without extension where data should be saved.
+    path : str or file-like
+        name of the file without extension where data should be saved,
+        or a binary file object to write to, e.g. an io.BytesIO.
     x : array-like
         x coordinates of the vertices.
     y : array-like
@@ -705,34 +1257,64 @@ def unstructuredGridToVTK(
     fieldData : dict, optional
         dictionary with variables associated with the field.
         Keys should be the names of the variable stored in each array.
+    workers, compression, compressionWorkers, writeWorkers, gatherWrites : optional
+        options of the writer, see VtkFile.
+    precision, precisionErrors, templates : optional
+        lossy precision and header cache, see the module docstring.
 
     Returns
     -------
     str
-        Full path to saved file.
+        Full path to saved file, or None if path is a file object.
     """
+    cellData = _reducePrecision(cellData, precision, precisionErrors)
+    pointData = _reducePrecision(pointData, precision, precisionErrors)
     assert x.size == y.size == z.size
     npoints = x.size
     ncells = cell_types.size
     assert offsets.size == ncells
 
-    w = VtkFile(path, VtkUnstructuredGrid)
-    w.openGrid()
-    w.openPiece(ncells=ncells, npoints=npoints)
+    key = _layoutKey(
+        "unstructuredGridToVTK",
+        x,
+        y,
+        z,
+        connectivity,
+        offsets,
+        cell_types,
+        cellData,
+        pointData,
+        fieldData,
+    )
+    template = _getTemplate(templates, key, compression)
+    w = VtkFile(
+        path,
+        VtkUnstructuredGrid,
+        workers=workers,
+        compression=compression,
+        compressionWorkers=compressionWorkers,
+        template=template,
+        writeWorkers=writeWorkers,
+        gatherWrites=gatherWrites,
+    )
+    if template is None:
+        w.openGrid()
+        w.openPiece(ncells=ncells, npoints=npoints)
 
-    w.openElement("Points")
-    w.addData("points", (x, y, z))
-    w.closeElement("Points")
-    w.openElement("Cells")
-    w.addData("connectivity", connectivity)
-    w.addData("offsets", offsets)
-    w.addData("types", cell_types)
-    w.closeElement("Cells")
+        w.openElement("Points")
+        w.addData("points", (x, y, z))
+        w.closeElement("Points")
+        w.openElement("Cells")
+        w.addData("connectivity", connectivity)
+        w.addData("offsets", offsets)
+        w.addData("types", cell_types)
+        w.closeElement("Cells")
 
-    _addDataToFile(w, cellData=cellData, pointData=pointData, fieldData=fieldData)
+        _addDataToFile(w, cellData=cellData, pointData=pointData, fieldData=fieldData)
 
-    w.closePiece()
-    w.closeGrid()
+        w.closePiece()
+        w.closeGrid()
+        _setTemplate(templates, key, w)
     w.appendData((x, y, z))
     w.appendData(connectivity).appendData(offsets).appendData(cell_types)
 
@@ -755,14 +1337,23 @@ def cylinderToVTK(
     cellData=None,
     pointData=None,
     fieldData=None,
+    workers=None,
+    compression=None,
+    compressionWorkers=None,
+    writeWorkers=None,
+    gatherWrites=False,
+    precision=None,
+    precisionErrors=None,
+    templates=None,
 ):
     """
     Export cylinder as VTK unstructured grid.
 
     Parameters
     ----------
-    path : str
-        name of the file without extension where data should be saved.
+    path : str or file-like
+        name of the file without extension where data should be saved,
+        or a binary file object to write to, e.g. an io.BytesIO.
     x0 : float
         x-center of the cylinder.
     y0 : float
@@ -792,11 +1383,15 @@ def cylinderToVTK(
     fieldData : dict, optional
         dictionary with variables associated with the field.
         Keys should be the names of the variable stored in each array.
+    workers, compression, compressionWorkers, writeWorkers, gatherWrites : optional
+        options of the writer, see VtkFile.
+    precision, precisionErrors, templates : optional
+        lossy precision and header cache, see the module docstring.
 
     Returns
     -------
     str
-        Full path to saved file.
+        Full path to saved file, or None if path is a file object.
 
     Notes
     -----
@@ -872,4 +1467,872 @@ def cylinderToVTK(
         cellData=cellData,
         pointData=pointData,
         fieldData=fieldData,
+        workers=workers,
+        compression=compression,
+        compressionWorkers=compressionWorkers,
+        writeWorkers=writeWorkers,
+        gatherWrites=gatherWrites,
+        precision=precision,
+        precisionErrors=precisionErrors,
+        templates=templates,
     )
+
+
+# =================================
+#       Partitioned export
+# =================================
+def _primeFactors(n):
+    # Prime factors of n in increasing order
+    factors, p = [], 2
+    while p * p <= n:
+        while n % p == 0:
+            factors.append(p)
+            n //= p
+        p += 1
+    if n > 1:
+        factors.append(n)
+    return factors
+
+
+def _splitCells(shape, nparts):
+    # Split a grid of cells in nparts blocks, cutting the longest axes first,
+    # and return the start and end cell indices of each block
+    counts = [1, 1, 1]
+    for p in reversed(_primeFactors(nparts)):
+        axis = max(range(3), key=lambda a: shape[a] / counts[a])
+        counts[axis] *= p
+    if any(c > n for c, n in zip(counts, shape)):
+        raise ValueError("Cannot split %s cells in %d parts." % (shape, nparts))
+    bounds = [[n * i // c for i in range(c + 1)] for n, c in zip(shape, counts)]
+    return [
+        (
+            (bounds[0][i], bounds[1][j], bounds[2][k]),
+            (bounds[0][i + 1], bounds[1][j + 1], bounds[2][k + 1]),
+        )
+        for k in range(counts[2])
+        for j in range(counts[1])
+        for i in range(counts[0])
+    ]
+
+
+def _sliceData(data, slices):
+    # Views of the arrays of a dictionary of scalar or vector data
+    if data is None:
+        return None
+    return {
+        key: (
+            tuple(a[slices] for a in value)
+            if isinstance(value, tuple)
+            else value[slices]
+        )
+        for key, value in data.items()
+    }
+
+
+def _contiguous(value):
+    # Copy the sliced arrays of a piece to contiguous memory
+    if isinstance(value, np.ndarray):
+        return np.asfortranarray(value)
+    if isinstance(value, tuple):
+        return tuple(_contiguous(v) for v in value)
+    if isinstance(value, dict):
+        return {k: _contiguous(v) for k, v in value.items()}
+    return value
+
+
+def _exportPiece(func, path, args, kwargs):
+    # Export a piece in a worker, which copies the slices of the piece
+    return func(path, *_contiguous(args), **_contiguous(kwargs))
+
+
+def _exportPieces(func, pieces, executor=None):
+    # Export (path, args, kwargs) pieces concurrently
+    if executor is None:
+        workers = min(len(pieces), os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return _exportPieces(func, pieces, executor)
+    futures = [executor.submit(_exportPiece, func, *piece) for piece in pieces]
+    return [f.result() for f in futures]
+
+
+def _partition(path, shape, nparts, ghostlevel, cellData, pointData):
+    # Yield the path, point extent, cell data and point data of each piece
+    for n, (start, end) in enumerate(_splitCells(shape, nparts)):
+        start = tuple(max(0, s - ghostlevel) for s in start)
+        end = tuple(min(m, e + ghostlevel) for m, e in zip(shape, end))
+        cells = tuple(slice(s, e) for s, e in zip(start, end))
+        points = tuple(slice(s, e + 1) for s, e in zip(start, end))
+        yield (
+            "%s_%d" % (path, n),
+            start,
+            end,
+            points,
+            _sliceData(cellData, cells),
+            _sliceData(pointData, points),
+        )
+
+
+def partitionedImageToVTK(
+    path,
+    nparts,
+    origin=(0.0, 0.0, 0.0),
+    spacing=(1.0, 1.0, 1.0),
+    cellData=None,
+    pointData=None,
+    ghostlevel=0,
+    executor=None,
+    precision=None,
+    precisionErrors=None,
+    **kwargs,
+):
+    """
+    Export image data as pieces written concurrently and a .pvti index.
+
+    Parameters
+    ----------
+    path : str
+        name of the index without extension.
+        Piece n is saved as path_n.vti.
+    nparts : int
+        number of pieces. The grid is cut along its longest axes.
+    origin, spacing, cellData, pointData : optional
+        see imageToVTK. Arrays must be indexed as data[i, j, k].
+    ghostlevel : int, optional
+        number of layers of cells by which neighbour pieces overlap.
+        The default is 0.
+    executor : concurrent.futures.Executor, optional
+        pool that writes the pieces, e.g. a ProcessPoolExecutor.
+        The default is None, which uses a pool of threads.
+    precision, precisionErrors : optional
+        see the module docstring.
+    **kwargs
+        other arguments of imageToVTK, e.g. compression.
+
+    Returns
+    -------
+    str
+        Full path to the saved index.
+    """
+    assert cellData is not None or pointData is not None
+    cellData = _reducePrecision(cellData, precision, precisionErrors)
+    pointData = _reducePrecision(pointData, precision, precisionErrors)
+    if cellData:
+        data = next(iter(cellData.values()))
+        shape = (data[0] if isinstance(data, tuple) else data).shape
+    else:
+        data = next(iter(pointData.values()))
+        shape = tuple(
+            n - 1 for n in (data[0] if isinstance(data, tuple) else data).shape
+        )
+
+    pieces, starts, ends = [], [], []
+    for piece, start, end, _, cells, points in _partition(
+        path, shape, nparts, ghostlevel, cellData, pointData
+    ):
+        kw = dict(kwargs, origin=origin, spacing=spacing, start=start)
+        pieces.append((piece, (), dict(kw, cellData=cells, pointData=points)))
+        starts.append(start)
+        ends.append(end)
+    _exportPieces(imageToVTK, pieces, executor)
+
+    return writeParallelVTKImage(
+        path,
+        starts=starts,
+        ends=ends,
+        sources=[os.path.basename(p[0]) + ".vti" for p in pieces],
+        origin=origin,
+        spacing=spacing,
+        ghostlevel=ghostlevel,
+        cellData=cellData,
+        pointData=pointData,
+    )
+
+
+def partitionedGridToVTK(
+    path,
+    x,
+    y,
+    z,
+    nparts,
+    cellData=None,
+    pointData=None,
+    ghostlevel=0,
+    executor=None,
+    precision=None,
+    precisionErrors=None,
+    **kwargs,
+):
+    """
+    Export a grid as pieces written concurrently and a .pvtr or .pvts index.
+
+    Parameters
+    ----------
+    path : str
+        name of the index without extension.
+        Piece n is saved as path_n.vtr or path_n.vts.
+    x, y, z : array-like
+        coordinates of a rectilinear or structured grid, see gridToVTK.
+    nparts : int
+        number of pieces. The grid is cut along its longest axes.
+    cellData, pointData : dict, optional
+        see gridToVTK. Arrays must be indexed as data[i, j, k].
+    ghostlevel : int, optional
+        number of layers of cells by which neighbour pieces overlap.
+        The default is 0.
+    executor : concurrent.futures.Executor, optional
+        pool that writes the pieces, e.g. a ProcessPoolExecutor.
+        The default is None, which uses a pool of threads.
+    precision, precisionErrors : optional
+        see the module docstring.
+    **kwargs
+        other arguments of gridToVTK, e.g. compression.
+
+    Returns
+    -------
+    str
+        Full path to the saved index.
+    """
+    cellData = _reducePrecision(cellData, precision, precisionErrors)
+    pointData = _reducePrecision(pointData, precision, precisionErrors)
+    isRect = x.ndim == 1
+    if isRect:
+        npoints = (x.size, y.size, z.size)
+    else:
+        npoints = x.shape
+    shape = tuple(n - 1 for n in npoints)
+
+    pieces, starts, ends = [], [], []
+    for piece, start, end, points, cells, pdata in _partition(
+        path, shape, nparts, ghostlevel, cellData, pointData
+    ):
+        if isRect:
+            coords = tuple(a[s] for a, s in zip((x, y, z), points))
+        else:
+            coords = (x[points], y[points], z[points])
+        kw = dict(kwargs, start=start, cellData=cells, pointData=pdata)
+        pieces.append((piece, coords, kw))
+        starts.append(start)
+        ends.append(end)
+    _exportPieces(gridToVTK, pieces, executor)
+
+    ext = ".vtr" if isRect else ".vts"
+    return writeParallelVTKGrid(
+        path,
+        coordsData=(npoints, x.dtype),
+        starts=starts,
+        ends=ends,
+        sources=[os.path.basename(p[0]) + ext for p in pieces],
+        ghostlevel=ghostlevel,
+        cellData=_describeData(cellData),
+        pointData=_describeData(pointData),
+    )
+
+
+# ==============================================================================
+
+
+# =================================
+#       Collective (MPI) export
+# =================================
+def _getComm(comm):
+    # The world communicator of mpi4py by default
+    if comm is None:
+        try:
+            from mpi4py import MPI
+        except ImportError:
+            raise ImportError("Collective export requires mpi4py.") from None
+        comm = MPI.COMM_WORLD
+    return comm
+
+
+def _collectivePiece(kwargs, coords=None, start=None, end=None):
+    # Describe the piece of this rank from the arguments of its export.
+    # The precision is applied here, so the types are those of the file.
+    precision = kwargs.pop("precision", None)
+    errors = kwargs.pop("precisionErrors", None)
+    piece = {"Coordinates": coords, "Start": start, "End": end}
+    for key, section in (("cellData", "CellData"), ("pointData", "PointData")):
+        data = _reducePrecision(kwargs.get(key), precision, errors)
+        kwargs[key] = data
+        described = _describeData(data) or {}
+        piece[section] = {
+            name: (np.dtype(dtype.name), ncomp)
+            for name, (dtype, ncomp) in described.items()
+        }
+    return piece
+
+
+def _collectiveExport(func, path, comm, args, kwargs, piece):
+    # Write the piece of this rank and gather the description of every piece
+    # on rank 0 with a single collective call. Other ranks return None.
+    comm = _getComm(comm)
+    rank = comm.Get_rank()
+    filename = func("%s_%d" % (path, rank), *args, **kwargs)
+    piece["Source"] = os.path.basename(filename)
+    pieces = comm.gather(piece, root=0)
+    if rank != 0:
+        return None
+    for p in pieces[1:]:
+        for section in ("PointData", "CellData", "Coordinates"):
+            if p[section] != pieces[0][section]:
+                raise ValueError(
+                    "%s of %s differ from %s."
+                    % (section, p["Source"], pieces[0]["Source"])
+                )
+    return pieces
+
+
+def _collectiveIndex(path, ext, pieces, ghostlevel, **kwargs):
+    # Write the index of the gathered pieces on rank 0
+    if pieces is None:
+        return os.path.abspath(path + ext)
+    sources = [p["Source"] for p in pieces]
+    # empty dictionaries, not None, so the sources are not read
+    cellData = pieces[0]["CellData"]
+    pointData = pieces[0]["PointData"]
+    if ext == ".pvtu":
+        return writeParallelVTKUnstructuredGrid(
+            path, sources, ghostlevel, cellData, pointData, pieces[0]["Coordinates"]
+        )
+    starts = [p["Start"] for p in pieces]
+    ends = [p["End"] for p in pieces]
+    if ext == ".pvti":
+        return writeParallelVTKImage(
+            path,
+            starts,
+            ends,
+            sources,
+            ghostlevel=ghostlevel,
+            cellData=cellData,
+            pointData=pointData,
+            **kwargs,
+        )
+    shape = tuple(
+        max(end[i] for end in ends) - min(start[i] for start in starts) + 1
+        for i in range(3)
+    )
+    return writeParallelVTKGrid(
+        path,
+        coordsData=(shape, pieces[0]["Coordinates"]),
+        starts=starts,
+        ends=ends,
+        sources=sources,
+        ghostlevel=ghostlevel,
+        cellData=cellData,
+        pointData=pointData,
+    )
+
+
+def collectiveImageToVTK(
+    path,
+    origin=(0.0, 0.0, 0.0),
+    spacing=(1.0, 1.0, 1.0),
+    cellData=None,
+    pointData=None,
+    start=(0, 0, 0),
+    ghostlevel=0,
+    comm=None,
+    **kwargs,
+):
+    """
+    Export the image data of each MPI rank as a piece of a .pvti file.
+
+    Must be called by every rank of the communicator. Each rank writes
+    its piece, the extents and data types of the pieces are gathered
+    on rank 0, which writes the index. Requires mpi4py.
+
+    Parameters
+    ----------
+    path : str
+        name of the index without extension, the same on every rank.
+        The piece of rank n is saved as path_n.vti.
+    origin, spacing : tuple, optional
+        origin and spacing of the whole image, see imageToVTK.
+    cellData, pointData : dict, optional
+        data of the piece of this rank, see imageToVTK.
+    start : tuple, optional
+        first point of the piece of this rank in the whole image.
+        The default is (0, 0, 0).
+    ghostlevel : int, optional
+        number of layers of cells by which neighbour pieces overlap.
+        The default is 0.
+    comm : mpi4py.MPI.Comm, optional
+        communicator of the ranks. The default is None, for COMM_WORLD.
+    **kwargs
+        other arguments of imageToVTK, e.g. compression.
+
+    Returns
+    -------
+    str
+        Full path to the index, which is complete once rank 0 returns.
+    """
+    kwargs = dict(
+        kwargs,
+        origin=origin,
+        spacing=spacing,
+        cellData=cellData,
+        pointData=pointData,
+        start=start,
+    )
+    piece = _collectivePiece(kwargs, start=tuple(start))
+    piece["End"] = _imageEnd(
+        start,
+        spacing,
+        kwargs["cellData"],
+        kwargs["pointData"],
+        kwargs.get("order", "F"),
+    )
+    pieces = _collectiveExport(imageToVTK, path, comm, (), kwargs, piece)
+    return _collectiveIndex(
+        path, ".pvti", pieces, ghostlevel, origin=origin, spacing=spacing
+    )
+
+
+def collectiveGridToVTK(
+    path,
+    x,
+    y,
+    z,
+    cellData=None,
+    pointData=None,
+    start=(0, 0, 0),
+    ghostlevel=0,
+    comm=None,
+    **kwargs,
+):
+    """
+    Export the grid of each MPI rank as a piece of a .pvtr or .pvts file.
+
+    Must be called by every rank of the communicator. Each rank writes
+    its piece, the extents and data types of the pieces are gathered
+    on rank 0, which writes the index. Requires mpi4py.
+
+    Parameters
+    ----------
+    path : str
+        name of the index without extension, the same on every rank.
+        The piece of rank n is saved as path_n.vtr or path_n.vts.
+    x, y, z : array-like
+        coordinates of the piece of this rank, see gridToVTK.
+    cellData, pointData : dict, optional
+        data of the piece of this rank, see gridToVTK.
+    start : tuple, optional
+        first point of the piece of this rank in the whole grid.
+        The default is (0, 0, 0).
+    ghostlevel : int, optional
+        number of layers of cells by which neighbour pieces overlap.
+        The default is 0.
+    comm : mpi4py.MPI.Comm, optional
+        communicator of the ranks. The default is None, for COMM_WORLD.
+    **kwargs
+        other arguments of gridToVTK, e.g. compression.
+
+    Returns
+    -------
+    str
+        Full path to the index, which is complete once rank 0 returns.
+    """
+    kwargs = dict(kwargs, cellData=cellData, pointData=pointData, start=start)
+    end = _gridEnd(x, y, z, start, kwargs.get("order", "F"))
+    piece = _collectivePiece(kwargs, np.dtype(x.dtype.name), tuple(start), end)
+    pieces = _collectiveExport(gridToVTK, path, comm, (x, y, z), kwargs, piece)
+    ext = ".pvtr" if np.ndim(x) == 1 else ".pvts"
+    return _collectiveIndex(path, ext, pieces, ghostlevel)
+
+
+def collectiveUnstructuredGridToVTK(
+    path,
+    x,
+    y,
+    z,
+    connectivity,
+    offsets,
+    cell_types,
+    cellData=None,
+    pointData=None,
+    ghostlevel=0,
+    comm=None,
+    **kwargs,
+):
+    """
+    Export the unstructured grid of each MPI rank as a piece of a .pvtu file.
+
+    Must be called by every rank of the communicator. Each rank writes
+    its piece, the data types of the pieces are gathered on rank 0,
+    which writes the index. Requires mpi4py.
+
+    Parameters
+    ----------
+    path : str
+        name of the index without extension, the same on every rank.
+        The piece of rank n is saved as path_n.vtu.
+    x, y, z, connectivity, offsets, cell_types : array-like
+        mesh of the piece of this rank, see unstructuredGridToVTK.
+    cellData, pointData : dict, optional
+        data of the piece of this rank, see unstructuredGridToVTK.
+    ghostlevel : int, optional
+        number of layers of cells by which neighbour pieces overlap.
+        The default is 0.
+    comm : mpi4py.MPI.Comm, optional
+        communicator of the ranks. The default is None, for COMM_WORLD.
+    **kwargs
+        other arguments of unstructuredGridToVTK, e.g. compression.
+
+    Returns
+    -------
+    str
+        Full path to the index, which is complete once rank 0 returns.
+    """
+    args = (x, y, z, connectivity, offsets, cell_types)
+    kwargs = dict(kwargs, cellData=cellData, pointData=pointData)
+    piece = _collectivePiece(kwargs, np.dtype(x.dtype.name))
+    pieces = _collectiveExport(unstructuredGridToVTK, path, comm, args, kwargs, piece)
+    return _collectiveIndex(path, ".pvtu", pieces, ghostlevel)
+
+
+# ==============================================================================
+
+
+# =================================
+#       Shared-file export
+# =================================
+def _describeArrays(section, data):
+    # planLayout description and data of the arrays of a dictionary
+    arrays = []
+    for key, value in (data or {}).items():
+        a = value[0] if isinstance(value, tuple) else value
+        ncomp = 3 if isinstance(value, tuple) else 1
+        arrays.append(((section, key, a.dtype.name, a.size, ncomp), value))
+    return arrays
+
+
+def _sharedExport(path, ftype, piece, arrays, comm, grid=None, **kwargs):
+    # Write the arrays of the piece of this rank into a file shared by all
+    # the ranks. Its offset is the exscan of the sizes of the pieces, while
+    # rank 0 gathers their descriptions and writes the header.
+    comm = _getComm(comm)
+    filename = path + ftype.ext
+    described = [d for d, _ in arrays]
+    nbytes = sum(np.dtype(t).itemsize * n * c + 8 for _, _, t, n, c in described)
+    offset = comm.exscan(nbytes) or 0  # None on rank 0
+    pieces = comm.gather((piece, described), root=0)
+    headerSize = None
+    if pieces is not None:
+        if grid is not None:
+            grid = grid([p for p, _ in pieces])
+        layout = planPieces(ftype, pieces, **(grid or {}))
+        layout.createFile(filename)
+        headerSize = layout.headerSize
+    headerSize = comm.bcast(headerSize, root=0)
+    writeAppendedArrays(filename, headerSize + offset, [a for _, a in arrays], **kwargs)
+    return os.path.abspath(filename)
+
+
+def sharedImageToVTK(
+    path,
+    origin=(0.0, 0.0, 0.0),
+    spacing=(1.0, 1.0, 1.0),
+    cellData=None,
+    pointData=None,
+    start=(0, 0, 0),
+    comm=None,
+    bufferSize=None,
+    workers=None,
+):
+    """
+    Export the image data of each rank as a piece of one shared .vti file.
+
+    Must be called by every rank of the communicator.
+    The ranks write their pieces concurrently into the appended data
+    of the same file, at offsets computed by an exscan of their sizes.
+    Rank 0 gathers the extents and types of the pieces and writes
+    the header. This avoids creating one file per rank.
+
+    Parameters
+    ----------
+    path : str
+        name of the file without extension, the same on every rank.
+    origin, spacing : tuple, optional
+        origin and spacing of the whole image, see imageToVTK.
+    cellData, pointData : dict, optional
+        data of the piece of this rank, see imageToVTK.
+        Arrays must be indexed as data[i, j, k].
+    start : tuple, optional
+        first point of the piece of this rank in the whole image.
+        The default is (0, 0, 0).
+    comm : optional
+        communicator of the ranks, a mpi4py.MPI.Comm or a
+        pyevtk.export.ProcessComm to use multiprocessing.
+        The default is None, for the COMM_WORLD of mpi4py.
+    bufferSize, workers : int, optional
+        see VtkFile.
+
+    Returns
+    -------
+    str
+        Full path to the file, which is complete once all ranks return.
+    """
+    assert cellData is not None or pointData is not None
+    if cellData:
+        data = next(iter(cellData.values()))
+        shape = (data[0] if isinstance(data, tuple) else data).shape
+    else:
+        data = next(iter(pointData.values()))
+        shape = tuple(
+            n - 1 for n in (data[0] if isinstance(data, tuple) else data).shape
+        )
+    end = tuple(s + n for s, n in zip(start, shape))
+
+    def grid(pieces):
+        return dict(
+            start=tuple(min(p["start"][i] for p in pieces) for i in range(3)),
+            end=tuple(max(p["end"][i] for p in pieces) for i in range(3)),
+            origin=origin,
+            spacing=spacing,
+        )
+
+    arrays = _describeArrays("Point", pointData) + _describeArrays("Cell", cellData)
+    return _sharedExport(
+        path,
+        VtkImageData,
+        dict(start=start, end=end),
+        arrays,
+        comm,
+        grid,
+        buffer_size=bufferSize,
+        workers=workers,
+    )
+
+
+def sharedUnstructuredGridToVTK(
+    path,
+    x,
+    y,
+    z,
+    connectivity,
+    offsets,
+    cell_types,
+    cellData=None,
+    pointData=None,
+    comm=None,
+    bufferSize=None,
+    workers=None,
+):
+    """
+    Export the unstructured grid of each rank as a piece of one shared .vtu file.
+
+    Must be called by every rank of the communicator.
+    The ranks write their pieces concurrently into the appended data
+    of the same file, at offsets computed by an exscan of their sizes.
+    Rank 0 gathers the sizes and types of the pieces and writes
+    the header. This avoids creating one file per rank.
+
+    Parameters
+    ----------
+    path : str
+        name of the file without extension, the same on every rank.
+    x, y, z, connectivity, offsets, cell_types : array-like
+        mesh of the piece of this rank, see unstructuredGridToVTK.
+    cellData, pointData : dict, optional
+        data of the piece of this rank, see unstructuredGridToVTK.
+    comm : optional
+        communicator of the ranks, a mpi4py.MPI.Comm or a
+        pyevtk.export.ProcessComm to use multiprocessing.
+        The default is None, for the COMM_WORLD of mpi4py.
+    bufferSize, workers : int, optional
+        see VtkFile.
+
+    Returns
+    -------
+    str
+        Full path to the file, which is complete once all ranks return.
+    """
+    assert x.size == y.size == z.size
+    assert offsets.size == cell_types.size
+    arrays = (
+        _describeArrays("Points", {"points": (x, y, z)})
+        + _describeArrays(
+            "Cells",
+            {"connectivity": connectivity, "offsets": offsets, "types": cell_types},
+        )
+        + _describeArrays("Point", pointData)
+        + _describeArrays("Cell", cellData)
+    )
+    return _sharedExport(
+        path,
+        VtkUnstructuredGrid,
+        dict(npoints=x.size, ncells=cell_types.size),
+        arrays,
+        comm,
+        buffer_size=bufferSize,
+        workers=workers,
+    )
+
+
+# ==============================================================================
+
+
+# =================================
+#       Aggregated export
+# =================================
+def _vertexPiece(x, y, z, data):
+    # Unstructured grid of the vertices of a points piece, see pointsToVTK
+    npoints = x.size
+    offsets = np.arange(start=1, stop=npoints + 1, dtype="int32")
+    connectivity = np.arange(npoints, dtype="int32")
+    cell_types = np.full(npoints, VtkVertex.tid, dtype="uint8")
+    return x, y, z, connectivity, offsets, cell_types, None, data
+
+
+def _writeUnstructuredPieces(path, pieces, **kwargs):
+    # Write the pieces gathered by an aggregator as the pieces of one .vtu
+    # file. Pieces without cells are skipped, and without any no file is written.
+    pieces = [p for p in pieces if p[5].size]
+    if not pieces:
+        return None
+    w = VtkFile(path, VtkUnstructuredGrid, **kwargs)
+    w.openGrid()
+    for x, y, z, connectivity, offsets, cell_types, cellData, pointData in pieces:
+        assert x.size == y.size == z.size
+        assert offsets.size == cell_types.size
+        w.openPiece(ncells=cell_types.size, npoints=x.size)
+        w.openElement("Points")
+        w.addData("points", (x, y, z))
+        w.closeElement("Points")
+        w.openElement("Cells")
+        w.addData("connectivity", connectivity)
+        w.addData("offsets", offsets)
+        w.addData("types", cell_types)
+        w.closeElement("Cells")
+        _addDataToFile(w, cellData=cellData, pointData=pointData)
+        w.closePiece()
+    w.closeGrid()
+    for x, y, z, connectivity, offsets, cell_types, cellData, pointData in pieces:
+        w.appendData((x, y, z))
+        w.appendData(connectivity).appendData(offsets).appendData(cell_types)
+        _appendDataToFile(w, cellData=cellData, pointData=pointData)
+    w.save()
+    return w.getFileName()
+
+
+def _aggregatedExport(path, piece, write, aggregators, comm):
+    # Gather the pieces of groups of consecutive ranks on the first rank
+    # of each group, which writes them with write(path, pieces).
+    # Rank 0 then writes the .pvtu index of the written files.
+    comm = _getComm(comm)
+    rank, size = comm.Get_rank(), comm.Get_size()
+    aggregators = max(1, min(aggregators, size))
+    color = rank * aggregators // size
+    group = comm.Split(color, rank)
+    pieces = group.gather(piece, root=0)
+    group.Free()
+    filename = None
+    if pieces is not None:
+        filename = write("%s_%d" % (path, color), pieces)
+        if filename is not None:
+            filename = os.path.basename(filename)
+    sources = comm.gather(filename, root=0)
+    if sources is None:
+        return os.path.abspath(path + ".pvtu")
+    sources = [s for s in sources if s is not None]
+    if not sources:
+        raise ValueError("All the pieces are empty.")
+    return writeParallelVTKUnstructuredGrid(path, sources)
+
+
+def aggregatedUnstructuredGridToVTK(
+    path,
+    x,
+    y,
+    z,
+    connectivity,
+    offsets,
+    cell_types,
+    cellData=None,
+    pointData=None,
+    aggregators=1,
+    comm=None,
+    **kwargs,
+):
+    """
+    Export the unstructured grids of many ranks to a few .vtu files.
+
+    Must be called by every rank of the communicator.
+    The ranks are split in groups of consecutive ranks, and the pieces
+    of each group are sent to its first rank, the aggregator, which
+    writes them as the pieces of one file. Rank 0 then writes the
+    .pvtu index of these files. This reduces the number of files
+    from the number of ranks to the number of aggregators.
+
+    Parameters
+    ----------
+    path : str
+        name of the index without extension, the same on every rank.
+        Aggregator n saves its pieces as path_n.vtu.
+    x, y, z, connectivity, offsets, cell_types : array-like
+        mesh of the piece of this rank, see unstructuredGridToVTK.
+        Pieces without cells are not written.
+    cellData, pointData : dict, optional
+        data of the piece of this rank, see unstructuredGridToVTK.
+    aggregators : int, optional
+        number of aggregators, i.e. of files. The default is 1.
+    comm : optional
+        communicator of the ranks, a mpi4py.MPI.Comm or a
+        pyevtk.export.ProcessComm to use multiprocessing.
+        The default is None, for the COMM_WORLD of mpi4py.
+    **kwargs
+        arguments of the VtkFile of the aggregators, e.g. compression.
+
+    Returns
+    -------
+    str
+        Full path to the index, which is complete once rank 0 returns.
+    """
+    piece = (x, y, z, connectivity, offsets, cell_types, cellData, pointData)
+
+    def write(path, pieces):
+        return _writeUnstructuredPieces(path, pieces, **kwargs)
+
+    return _aggregatedExport(path, piece, write, aggregators, comm)
+
+
+def aggregatedPointsToVTK(path, x, y, z, data=None, aggregators=1, comm=None, **kwargs):
+    """
+    Export the points of many ranks to a few .vtu files.
+
+    Must be called by every rank of the communicator.
+    The points and data of each rank are sent to an aggregator,
+    which writes them as the pieces of one file, and rank 0
+    writes the .pvtu index of these files,
+    see aggregatedUnstructuredGridToVTK.
+
+    Parameters
+    ----------
+    path : str
+        name of the index without extension, the same on every rank.
+        Aggregator n saves its pieces as path_n.vtu.
+    x, y, z : array-like
+        coordinates of the points of this rank, see pointsToVTK.
+        Ranks without points are not written.
+    data : dict, optional
+        data of the points of this rank, see pointsToVTK.
+    aggregators : int, optional
+        number of aggregators, i.e. of files. The default is 1.
+    comm : optional
+        communicator of the ranks, a mpi4py.MPI.Comm or a
+        pyevtk.export.ProcessComm to use multiprocessing.
+        The default is None, for the COMM_WORLD of mpi4py.
+    **kwargs
+        arguments of the VtkFile of the aggregators, e.g. compression.
+
+    Returns
+    -------
+    str
+        Full path to the index, which is complete once rank 0 returns.
+    """
+
+    def write(path, pieces):
+        pieces = [_vertexPiece(*p) for p in pieces]
+        return _writeUnstructuredPieces(path, pieces, **kwargs)
+
+    return _aggregatedExport(path, (x, y, z, data), write, aggregators, comm)
@@ -25,9 +25,32 @@
 
 import sys
 import os
+import time
+from abc import ABC, abstractmethod
+import lzma
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
 import numpy as np
 
-from .evtk import writeBlockSize, writeArrayToFile, writeArraysToFile
+try:
+    import lz4.block
+except ImportError:  # LZ4 compression is optional
+    lz4 = None
+
+from .evtk import (
+    writeBlockSize,
+    writeArrayToFile,
+    writeArraysToFile,
+    compressArrayToBlocks,
+    compressArraysToBlocks,
+    sampleBlocks,
+    PositionalWriter,
+    GatherWriter,
+    preallocateFile,
+)
 from .xml import XmlWriter
 
 # ================================
@@ -175,6 +198,281 @@ VtkQuadraticTetra = VtkCellType(24, "Quadratic_Tetra")
 VtkQuadraticHexahedron = VtkCellType(25, "Quadratic_Hexahedron")
 
 
+#    COMPRESSORS
+class VtkCompressor(ABC):
+    """
+    Base class of the wrappers of VTK data compressors.
+
+    VTK files use a single compressor for all arrays,
+    but the compression level can be chosen per array.
+
+    Parameters
+    ----------
+    name : str
+        Name of the VTK compressor class.
+    level : int
+        Compression level.
+    block_size : int, optional
+        Size in bytes of the uncompressed blocks.
+        The default is 32768, as in VTK.
+    levels : dict, optional
+        Compression level of individual arrays.
+        Keys are array names, e.g. "points" or "connectivity",
+        values are levels or None for the cheapest setting of the
+        compressor, e.g. for noisy data that does not compress.
+        Only zlib can store arrays uncompressed, with level 0,
+        since VTK cannot read uncompressed LZMA or LZ4 blocks.
+        Other arrays use level.
+        The default is None.
+    """
+
+    min_level = 0
+    candidate_levels = ()
+    adaptive = False
+
+    def __init__(self, name, level, block_size=32768, levels=None):
+        self.name = name
+        self.level = level
+        self.block_size = block_size
+        self.levels = dict(levels) if levels else {}
+
+    def __str__(self):
+        return "Compressor: %s  Level: %d  Block size: %d \n" % (
+            self.name,
+            self.level,
+            self.block_size,
+        )
+
+    def getLevel(self, name=None):
+        """Return the compression level used for the array called name."""
+        level = self.levels.get(name, self.level)
+        if level is None:
+            return self.min_level
+        return level
+
+    @abstractmethod
+    def compress(self, data, level=None):
+        """Compress a bytes-like object."""
+
+
+class VtkZLibCompressor(VtkCompressor):
+    """
+    zlib compressor, read by vtkZLibDataCompressor.
+
+    Parameters
+    ----------
+    level : int, optional
+        Compression level from 0 (no compression) to 9.
+        The default is -1, the zlib default level.
+    block_size : int, optional
+        Size in bytes of the uncompressed blocks.
+        The default is 32768.
+    levels : dict, optional
+        Compression level of individual arrays, see VtkCompressor.
+        A level of 0 or None stores the blocks uncompressed.
+    """
+
+    candidate_levels = (0, 1, 3, 6, 9)
+
+    def __init__(self, level=-1, block_size=32768, levels=None):
+        super().__init__("vtkZLibDataCompressor", level, block_size, levels)
+
+    def compress(self, data, level=None):
+        """Compress a bytes-like object."""
+        if level is None:
+            level = self.level
+        return zlib.compress(data, level)
+
+
+class VtkLZMACompressor(VtkCompressor):
+    """
+    LZMA compressor, read by vtkLZMADataCompressor.
+
+    Gives the best compression ratio, but is slow.
+
+    Parameters
+    ----------
+    level : int, optional
+        Compression preset from 0 to 9.
+        The default is 6.
+    block_size : int, optional
+        Size in bytes of the uncompressed blocks.
+        The default is 32768.
+    levels : dict, optional
+        Compression level of individual arrays, see VtkCompressor.
+        Preset 0, the cheapest, still compresses the blocks:
+        arrays cannot be stored uncompressed.
+    """
+
+    candidate_levels = (0, 1, 3, 6, 9)
+
+    def __init__(self, level=6, block_size=32768, levels=None):
+        super().__init__("vtkLZMADataCompressor", level, block_size, levels)
+
+    def compress(self, data, level=None):
+        """Compress a bytes-like object."""
+        if level is None:
+            level = self.level
+        return lzma.compress(
+            data, format=lzma.FORMAT_XZ, check=lzma.CHECK_CRC64, preset=level
+        )
+
+
+class VtkLZ4Compressor(VtkCompressor):
+    """
+    LZ4 compressor, read by vtkLZ4DataCompressor.
+
+    Very fast with a moderate compression ratio.
+    Requires the lz4 package.
+
+    Parameters
+    ----------
+    level : int, optional
+        Compression level from 1 to 12.
+        Levels up to 9 use the fast mode with an acceleration of
+        10 - level, higher levels use the high compression mode.
+        The default is 9, which is the default LZ4 setting.
+    block_size : int, optional
+        Size in bytes of the uncompressed blocks.
+        The default is 32768.
+    levels : dict, optional
+        Compression level of individual arrays, see VtkCompressor.
+        Level 1, the cheapest, still compresses the blocks:
+        arrays cannot be stored uncompressed.
+    """
+
+    min_level = 1
+    candidate_levels = (1, 5, 9, 12)
+
+    def __init__(self, level=9, block_size=32768, levels=None):
+        if lz4 is None:
+            raise ImportError("The lz4 package is required for LZ4 compression.")
+        super().__init__("vtkLZ4DataCompressor", level, block_size, levels)
+
+    def compress(self, data, level=None):
+        """Compress a bytes-like object."""
+        if level is None:
+            level = self.level
+        if level > 9:
+            return lz4.block.compress(
+                data, mode="high_compression", compression=level, store_size=False
+            )
+        return lz4.block.compress(
+            data, mode="fast", acceleration=10 - max(level, 1), store_size=False
+        )
+
+
+class VtkAdaptiveCompressor(VtkCompressor):
+    """
+    Compressor that chooses the compression level of each array.
+
+    A few blocks of each array are compressed with every candidate
+    level of the underlying compressor to estimate the compression ratio
+    and speed. The level with the best ratio that still compresses at
+    the target throughput is chosen or, if no throughput is given, the
+    level that minimizes the time to compress and write the data
+    with the given disk bandwidth.
+    Since VTK files use a single compressor,
+    only the level is chosen per array.
+
+    Parameters
+    ----------
+    compressor : str or VtkCompressor, optional
+        Underlying compressor, "zlib", "lzma" or "lz4".
+        The default is "zlib".
+    throughput : float, optional
+        Minimum compression throughput in MB/s of uncompressed data.
+        The default is None.
+    bandwidth : float, optional
+        Write bandwidth of the storage in MB/s.
+        Only used if throughput is None.
+        The default is 500.
+    nsamples : int, optional
+        Number of blocks sampled from each array.
+        The default is 4.
+    levels : dict, optional
+        Fixed compression level of individual arrays,
+        which are not tuned, see VtkCompressor.
+    timer : callable, optional
+        Clock in seconds used to measure the compression speed.
+        The default is time.perf_counter.
+    """
+
+    adaptive = True
+
+    def __init__(
+        self,
+        compressor="zlib",
+        throughput=None,
+        bandwidth=500.0,
+        nsamples=4,
+        levels=None,
+        timer=time.perf_counter,
+    ):
+        if not isinstance(compressor, VtkCompressor):
+            compressor = compressors[compressor]()
+        super().__init__(
+            compressor.name, compressor.level, compressor.block_size, levels
+        )
+        self.compressor = compressor
+        self.min_level = compressor.min_level
+        self.candidate_levels = compressor.candidate_levels
+        self.throughput = throughput
+        self.bandwidth = bandwidth
+        self.nsamples = nsamples
+        self.timer = timer
+
+    def compress(self, data, level=None):
+        """Compress a bytes-like object."""
+        return self.compressor.compress(data, level)
+
+    def chooseLevel(self, samples, workers=None):
+        """
+        Choose the compression level for an array.
+
+        Parameters
+        ----------
+        samples : list
+            bytes-like objects sampled from the array.
+        workers : int, optional
+            number of threads that will compress the array.
+            The default is None.
+
+        Returns
+        -------
+        int
+            The compression level.
+        """
+        nbytes = sum(len(s) for s in samples)
+        if nbytes == 0:
+            return self.min_level
+        speedup = max(1, workers or 1)
+        candidates = []
+        for level in self.candidate_levels:
+            t0 = self.timer()
+            csize = sum(len(self.compressor.compress(s, level)) for s in samples)
+            elapsed = max(self.timer() - t0, 1e-9)
+            speed = nbytes / elapsed * speedup / 1e6  # in MB/s
+            candidates.append((level, csize / nbytes, speed))
+
+        if self.throughput is not None:
+            fast = [c for c in candidates if c[2] >= self.throughput]
+            if not fast:
+                return max(candidates, key=lambda c: c[2])[0]
+            return min(fast, key=lambda c: c[1])[0]
+        # seconds to compress and write one MB of data
+        return min(candidates, key=lambda c: 1 / c[2] + c[1] / self.bandwidth)[0]
+
+
+# Map compression names to compressors
+compressors = {
+    "zlib": VtkZLibCompressor,
+    "lzma": VtkLZMACompressor,
+    "lz4": VtkLZ4Compressor,
+    "auto": VtkAdaptiveCompressor,
+}
+
+
 # ==============================
 #       Helper functions
 # ==============================
@@ -202,6 +500,279 @@ def _get_byte_order():
     return "BigEndian"
 
 
+def _get_compressor(compression):
+    if compression is None or compression is False:
+        return None
+    if isinstance(compression, VtkCompressor):
+        return compression
+    if compression is True:
+        return VtkZLibCompressor()
+    if compression in compressors:
+        return compressors[compression]()
+    raise ValueError("Unknown compression: " + str(compression))
+
+
+# ================================
+#        VtkLayout class
+# ================================
+class VtkLayout:
+    """
+    Byte layout of a VTK file with appended data.
+
+    Parameters
+    ----------
+    headerSize : int
+        size in bytes of everything before the appended data,
+        i.e. the xml header up to and including the "_" marker.
+    arrays : list
+        (name, offset, nbytes) of each appended array,
+        where offset is relative to the start of the appended data
+        and nbytes includes the block header.
+    footerSize : int
+        size in bytes of the xml after the appended data.
+    header : bytes, optional
+        the header itself, if it is known.
+        The default is None.
+    types : list, optional
+        (numpy dtype, number of components) of each appended array.
+        The default is None.
+
+    Notes
+    -----
+    A layout with its header can be used as the template of
+    files with the same header, see VtkFile.
+    """
+
+    def __init__(self, headerSize, arrays, footerSize, header=None, types=None):
+        self.headerSize = headerSize
+        self.arrays = list(arrays)
+        self.footerSize = footerSize
+        self.header = header
+        self.types = types
+
+    def __str__(self):
+        return "Header: %d  Arrays: %d  Size: %d \n" % (
+            self.headerSize,
+            len(self.arrays),
+            self.getSize(),
+        )
+
+    def getDataSize(self):
+        """Return the size in bytes of the appended data."""
+        return sum(nbytes for _, _, nbytes in self.arrays)
+
+    def getSize(self):
+        """Return the total size in bytes of the file."""
+        return self.headerSize + self.getDataSize() + self.footerSize
+
+    def getPositions(self):
+        """Return the absolute position in the file of each appended array."""
+        return [self.headerSize + offset for _, offset, _ in self.arrays]
+
+    def createFile(self, filename):
+        """
+        Create a file with this layout, whose arrays are written later.
+
+        The header and the footer are written and the appended data
+        is preallocated, so that several processes can then write
+        their arrays concurrently with writeAppendedArrays.
+
+        Parameters
+        ----------
+        filename : str
+            path of the file, including its extension.
+        """
+        if self.header is None:
+            raise ValueError("The layout has no header.")
+        with open(filename, "wb") as f:
+            preallocateFile(f.fileno(), self.getSize())
+            f.write(self.header)
+            f.seek(self.headerSize + self.getDataSize())
+            f.write(_FOOTER.encode())
+
+
+def planLayout(
+    ftype,
+    arrays,
+    start=None,
+    end=None,
+    origin=None,
+    spacing=None,
+    npoints=None,
+    ncells=None,
+):
+    """
+    Compute the byte layout of a VTK file without writing it.
+
+    The header is built in memory with the same calls
+    as the high-level functions, so the layout is exact.
+
+    Parameters
+    ----------
+    ftype : VtkFileType
+        file type, e.g. VtkImageData.
+    arrays : list
+        (section, name, dtype, nelem, ncomp) of each array,
+        in the order they are added and appended.
+        section is "Points", "Coordinates" or "Cells",
+        or "Point", "Cell" or "Field" for data arrays.
+        dtype is a numpy type name, e.g. "float64".
+    start, end : array-like, optional
+        extents of the piece, see VtkFile.openGrid.
+    origin, spacing : array-like, optional
+        image data geometry, see VtkFile.openGrid.
+    npoints, ncells : int, optional
+        size of unstructured pieces, see VtkFile.openPiece.
+
+    Returns
+    -------
+    VtkLayout
+        The layout of the file, including its header.
+    """
+    piece = dict(start=start, end=end, npoints=npoints, ncells=ncells)
+    return planPieces(ftype, [(piece, arrays)], start, end, origin, spacing)
+
+
+def planPieces(ftype, pieces, start=None, end=None, origin=None, spacing=None):
+    """
+    Compute the byte layout of a VTK file with several pieces.
+
+    Parameters
+    ----------
+    ftype : VtkFileType
+        file type, e.g. VtkImageData.
+    pieces : list
+        (piece, arrays) of each piece, where piece is a dictionary of
+        arguments of VtkFile.openPiece, e.g. start and end or npoints
+        and ncells, and arrays are described as in planLayout.
+        The arrays of all the pieces are appended one after the other.
+    start, end : array-like, optional
+        whole extent of the grid, see VtkFile.openGrid.
+    origin, spacing : array-like, optional
+        image data geometry, see VtkFile.openGrid.
+
+    Returns
+    -------
+    VtkLayout
+        The layout of the file, including its header.
+    """
+    w = VtkFile(None, ftype)
+    w.openGrid(start=start, end=end, origin=origin, spacing=spacing)
+    for piece, arrays in pieces:
+        w.openPiece(**piece)
+        _addArrayHeaders(w, arrays)
+        w.closePiece()
+    w.closeGrid()
+    return w.getLayout()
+
+
+def _addArrayHeaders(w, arrays):
+    """Add the headers of the arrays of a piece, see planLayout."""
+    i = 0
+    while i < len(arrays):
+        section = arrays[i][0]
+        group = []
+        while i < len(arrays) and arrays[i][0] == section:
+            group.append(arrays[i][1:])
+            i += 1
+        if section in ("Point", "Cell", "Field"):
+            # first scalar and vector arrays are the default attributes
+            scalars = next((a[0] for a in group if a[3] == 1), None)
+            vectors = next((a[0] for a in group if a[3] == 3), None)
+            if section == "Field":
+                scalars = vectors = None
+            w.openData(section, scalars=scalars, vectors=vectors)
+        else:
+            w.openElement(section)
+        for name, dtype, nelem, ncomp in group:
+            w.addHeader(name, dtype, nelem, ncomp)
+        if section in ("Point", "Cell", "Field"):
+            w.closeData(section)
+        else:
+            w.closeElement(section)
+
+
+def _writeArray(stream, data, order, buffer_size=None, workers=None):
+    """Write the block size and the data of one uncompressed array."""
+    if isinstance(data, tuple):  # 3 numpy arrays
+        ncomp = len(data)
+        assert ncomp == 3
+        dsize = data[0].dtype.itemsize
+        nelem = data[0].size
+        block_size = ncomp * nelem * dsize
+        # if self.largeFile == False:
+        writeBlockSize(stream, block_size)
+        # else:
+        #    writeBlockSize64Bit(stream, block_size)
+        x, y, z = data[0], data[1], data[2]
+        writeArraysToFile(
+            stream,
+            x,
+            y,
+            z,
+            buffer_size=buffer_size,
+            order=order,
+            workers=workers,
+        )
+
+    elif isinstance(data, np.ndarray) and (
+        data.ndim == 1 or data.ndim == 3
+    ):  # single numpy array
+        ncomp = 1
+        dsize = data.dtype.itemsize
+        nelem = data.size
+        block_size = ncomp * nelem * dsize
+        # if self.largeFile == False:
+        writeBlockSize(stream, block_size)
+        # else:
+        #    writeBlockSize64Bit(stream, block_size)
+        writeArrayToFile(
+            stream,
+            data,
+            buffer_size=buffer_size,
+            order=order,
+            workers=workers,
+        )
+
+    else:
+        assert False
+
+
+def writeAppendedArrays(
+    filename, position, arrays, order="F", buffer_size=None, workers=None
+):
+    """
+    Write arrays into the appended data of an existing file.
+
+    Several processes can write disjoint parts of the same file,
+    created by VtkLayout.createFile, at the same time.
+
+    Parameters
+    ----------
+    filename : str
+        path of the file, including its extension.
+    position : int
+        absolute position in the file of the first array,
+        i.e. the header size plus the offset of the array.
+    arrays : list
+        numpy arrays or tuples of 3 numpy arrays, see VtkFile.appendData,
+        written one after the other with their block sizes.
+    order : {"F", "C"}, optional
+        Index order of three-dimensional arrays, see VtkFile.appendData.
+        The default is "F".
+    buffer_size, workers : int, optional
+        see VtkFile.
+    """
+    with open(filename, "r+b", buffering=0) as f:
+        if hasattr(os, "pwrite"):
+            stream = PositionalWriter(f.fileno(), position)
+        else:
+            f.seek(position)
+            stream = f
+        for data in arrays:
+            _writeArray(stream, data, order, buffer_size, workers)
+
+
 # ================================
 #        VtkGroup class
 # ================================
@@ -211,18 +782,24 @@ class VtkGroup:
 
     Parameters
     ----------
-    filepath : str
-        filename without extension.
+    filepath : str or file-like or int
+        filename without extension, a binary file object
+        or a file descriptor open for writing.
+        The files added to a group written to a file object
+        are stored relative to the current directory.
     """
 
     def __init__(self, filepath):
-        self.xml = XmlWriter(filepath + ".pvd")
+        self.xml = XmlWriter(_get_target(filepath, ".pvd"), buffered=True)
         self.xml.openElement("VTKFile")
         self.xml.addAttributes(
             type="Collection", version="0.1", byte_order=_get_byte_order()
         )
         self.xml.openElement("Collection")
-        self.root = os.path.dirname(filepath)
+        if isinstance(filepath, str):
+            self.root = os.path.dirname(filepath)
+        else:
+            self.root = os.curdir
 
     def save(self):
         """Close this VtkGroup."""
@@ -261,6 +838,20 @@ class VtkGroup:
         self.xml.closeElement()
 
 
+def _get_target(filepath, ext):
+    """Return the file name of a path without extension or a file object."""
+    if filepath is None or hasattr(filepath, "write"):
+        return filepath
+    if isinstance(filepath, int):
+        # file descriptor, left open like file objects
+        return os.fdopen(filepath, "wb", closefd=False)
+    return filepath + ext
+
+
+# Closing tags written after the appended data
+_FOOTER = "\n</AppendedData>\n</VTKFile>"
+
+
 # ================================
 #        VtkFile class
 # ================================
@@ -270,32 +861,158 @@ class VtkFile:
 
     Parameters
     ----------
-    filepath : str
-        filename without extension.
+    filepath : str or file-like or int
+        filename without extension, or a binary file object,
+        e.g. an io.BytesIO, a pipe or a socket file,
+        or a file descriptor open for writing.
+        File objects and descriptors do not need to be seekable
+        and are not closed by save.
+        If None, the file is written to memory,
+        which can be used to plan its layout.
     ftype : str
         file type, e.g. VtkImageData, etc.
     largeFile : bool, optional
         If size of the stored data cannot be represented by a UInt32.
         The default is False.
+    bufferSize : int, optional
+        Maximum size in bytes of the scratch memory used to
+        encode each appended array, e.g. 64 * 1024**2.
+        Arrays are then reordered, interleaved and byteswapped
+        slab by slab, so peak memory does not grow with their size.
+        The default is None, which encodes scalar arrays in one piece.
+    workers : int, optional
+        Number of threads used to transpose, interleave and
+        byteswap the appended arrays.
+        The default is None, which does all the work in the calling thread.
+    compression : str or VtkCompressor, optional
+        Compress the appended data.
+        Either "zlib" (or True), "lzma", "lz4", "auto" or a VtkCompressor
+        instance, e.g. VtkZLibCompressor(level=9, levels={"noise": 0}).
+        "auto" is a VtkAdaptiveCompressor, which tunes the zlib level
+        of each array. The chosen levels are stored in compressionLevels.
+        Since the offsets in the header depend on the compressed sizes,
+        arrays are compressed by addData and kept in memory
+        until they are written by appendData. With a bufferSize,
+        at most bufferSize bytes of compressed arrays are kept
+        and the others are compressed again by appendData.
+        The default is None, which writes uncompressed data.
+    compressionWorkers : int, optional
+        Number of threads used to compress the blocks of each array.
+        The default is None, which compresses in the calling thread.
+    template : VtkLayout, optional
+        Layout of a file with the same header, see getLayout.
+        Its header is written as is, so only appendData must be
+        called, with arrays of the same types and sizes.
+        appendData raises a ValueError for arrays that do not match.
+        Cannot be used with compression.
+        The default is None, which builds the header.
+    writeWorkers : int, optional
+        Number of threads that write the appended arrays concurrently.
+        The file is preallocated when the appended data is opened
+        and each array is written with os.pwrite at its offset,
+        which is known from the header. Arrays passed to appendData
+        must not be modified until the file is saved.
+        Ignored if os.pwrite is not available or filepath is a file object.
+        The default is None, which writes the arrays one after the other.
+    gatherWrites : bool, optional
+        Gather the block sizes and the data of the appended arrays
+        and write them with os.writev in a few system calls,
+        which helps with many small arrays. Arrays passed to appendData
+        must not be modified until the file is saved.
+        The header is written by the same system calls as the data.
+        Ignored if os.writev is not available, filepath is a file object
+        or writeWorkers are used.
+        The default is False.
     """
 
-    def __init__(self, filepath, ftype):
+    def __init__(
+        self,
+        filepath,
+        ftype,
+        bufferSize=None,
+        workers=None,
+        compression=None,
+        compressionWorkers=None,
+        template=None,
+        writeWorkers=None,
+        gatherWrites=False,
+    ):
         self.ftype = ftype
-        self.filename = filepath + ftype.ext
-        self.xml = XmlWriter(self.filename)
+        self.bufferSize = bufferSize
+        self.workers = workers
+        self.compressor = _get_compressor(compression)
+        self.compressionWorkers = compressionWorkers
+        self.compressionLevels = {}  # compression level used for each array
+        self.compressed = deque()  # compressed arrays waiting to be appended
+        self.compressedSize = 0  # size in bytes of the kept compressed arrays
+        target = _get_target(filepath, ftype.ext)
+        self.filename = target if isinstance(target, str) else None
+        self.xml = XmlWriter(target, addDeclaration=template is None, buffered=True)
         self.offset = 0  # offset in bytes after beginning of binary section
+        self.arrays = []  # name, offset and size of each appended array
+        self.arrayTypes = []  # numpy type and components of each appended array
+        self.header = None  # header bytes, once the appended data is open
         self.appendedDataIsOpen = False
-        self.xml.openElement("VTKFile").addAttributes(
-            type=ftype.name,
-            version="1.0",
-            byte_order=_get_byte_order(),
-            header_type="UInt64",
+        if self.filename is None or not hasattr(os, "pwrite"):
+            writeWorkers = None
+        self.writeWorkers = writeWorkers
+        self.gatherWrites = (
+            gatherWrites
+            and not writeWorkers
+            and self.filename is not None
+            and hasattr(os, "writev")
         )
+        self.gatherer = None  # pending vectored writes
+        self.writer = None  # thread pool of positional writes
+        self.writes = []  # pending positional writes
+        self.dataStart = None  # position of the appended data, once preallocated
+        self.memmap = None  # memory map of the appended data
+        self.views = []  # writable views of the mapped arrays
+        self.template = template
+        self.appended = 0  # number of appended arrays
+        if template is not None:
+            if self.compressor:
+                raise ValueError("Templates cannot be used with compression.")
+            self.xml.restore(template.header, ["VTKFile", "AppendedData"])
+            self.header = template.header
+            self.arrays = list(template.arrays)
+            self.arrayTypes = list(template.types)
+            self.offset = template.getDataSize()
+            self.appendedDataIsOpen = True
+        else:
+            self.xml.openElement("VTKFile").addAttributes(
+                type=ftype.name,
+                version="1.0",
+                byte_order=_get_byte_order(),
+                header_type="UInt64",
+            )
+            if self.compressor:
+                self.xml.addAttributes(compressor=self.compressor.name)
 
     def getFileName(self):
         """Return absolute path to this file."""
+        if self.filename is None:
+            return None
         return os.path.abspath(self.filename)
 
+    def getLayout(self):
+        """
+        Return the byte layout of this file.
+
+        Must be called once the header is complete, i.e.
+        after all arrays were added and the grid was closed.
+        This opens the appended data section.
+
+        Returns
+        -------
+        VtkLayout
+            The layout of this file.
+        """
+        self.openAppendedData()
+        return VtkLayout(
+            self.xml.size, self.arrays, len(_FOOTER), self.header, self.arrayTypes
+        )
+
     def openPiece(
         self,
         start=None,
@@ -495,7 +1212,7 @@ class VtkFile:
         """
         self.xml.closeElement(self.ftype.name)
 
-    def addHeader(self, name, dtype, nelem, ncomp):
+    def addHeader(self, name, dtype, nelem, ncomp, nbytes=None):
         """
         Add data array description to xml header section.
 
@@ -509,6 +1226,11 @@ class VtkFile:
             number of elements in array.
         ncomp : int
             number of components, 1 (=scalar) and 3 (=vector).
+        nbytes : int, optional
+            size in bytes of the appended block, including its header.
+            Required for compressed files.
+            The default is None, which computes the size
+            of the uncompressed block.
 
         Returns
         -------
@@ -521,6 +1243,10 @@ class VtkFile:
         Use addData if you want to add a numpy array.
         """
         dtype = np_to_vtk[dtype]
+        if nbytes is None:
+            if self.compressor:
+                raise ValueError("Compressed files need the data, use addData.")
+            nbytes = nelem * ncomp * dtype.size + 8  # add 8 to indicate array size
 
         self.xml.openElement("DataArray")
         self.xml.addAttributes(
@@ -532,10 +1258,12 @@ class VtkFile:
         )
         self.xml.closeElement()
 
-        self.offset += nelem * ncomp * dtype.size + 8  # add 8 to indicate array size
+        self.arrays.append((name, self.offset, nbytes))
+        self.arrayTypes.append((np.dtype(dtype.name.lower()), ncomp))
+        self.offset += nbytes
         return self
 
-    def addData(self, name, data):
+    def addData(self, name, data, order="F"):
         """
         Add array description to xml header section.
 
@@ -548,19 +1276,87 @@ class VtkFile:
             If a tuple, the individual arrays must represent the components
             of a vector field.
             All arrays must be one dimensional or three-dimensional.
+        order : {"F", "C"}, optional
+            Index order of three-dimensional arrays, see appendData.
+            Only used to compress the data of compressed files.
+            The default is "F".
         """
         if isinstance(data, tuple):  # vector data
             assert len(data) == 3
             x = data[0]
-            self.addHeader(name, x.dtype.name, x.size, 3)
+            nbytes = self._compress(name, data, order)
+            self.addHeader(name, x.dtype.name, x.size, 3, nbytes)
         elif isinstance(data, np.ndarray):
             if data.ndim == 1 or data.ndim == 3:
-                self.addHeader(name, data.dtype.name, data.size, 1)
+                nbytes = self._compress(name, data, order)
+                self.addHeader(name, data.dtype.name, data.size, 1, nbytes)
             else:
                 assert False, "Bad array shape: " + str(data.shape)
         else:
             assert False, "Argument must be a Numpy array"
 
+    def _compress(self, name, data, order):
+        """
+        Compress data and queue it to be written by appendData.
+
+        Returns the size of the compressed block or None
+        if this file is not compressed.
+        """
+        if not self.compressor:
+            return None
+        c = self.compressor
+        if c.adaptive and name not in c.levels:
+            samples = sampleBlocks(data, c.block_size, c.nsamples, order)
+            level = c.chooseLevel(samples, self.compressionWorkers)
+        else:
+            level = c.getLevel(name)
+        self.compressionLevels[name] = level
+        blocks = self._compressBlocks(data, level, order)
+        nbytes = sum(len(b) for b in blocks)
+        if self.bufferSize is not None:
+            if self.compressedSize + nbytes > self.bufferSize:
+                blocks = None  # compressed again by appendData
+            else:
+                self.compressedSize += nbytes
+        self.compressed.append((data, level, nbytes, blocks))
+        return nbytes
+
+    def _compressBlocks(self, data, level, order):
+        """Compress one array to blocks at a given level."""
+        c = self.compressor
+        compress = partial(c.compress, level=level)
+        kwargs = dict(
+            buffer_size=self.bufferSize,
+            order=order,
+            workers=self.workers,
+            compression_workers=self.compressionWorkers,
+        )
+        if isinstance(data, tuple):
+            x, y, z = data
+            return compressArraysToBlocks(x, y, z, compress, c.block_size, **kwargs)
+        return compressArrayToBlocks(data, compress, c.block_size, **kwargs)
+
+    def _compressed(self, data, order):
+        """Return the compressed blocks of the next added array."""
+        if not self.compressed:
+            raise ValueError("appendData called more often than addData.")
+        added, level, nbytes, blocks = self.compressed.popleft()
+        if isinstance(data, tuple) and isinstance(added, tuple):
+            same = len(data) == len(added) and all(a is b for a, b in zip(data, added))
+        else:
+            same = data is added
+        if not same:
+            raise ValueError(
+                "Arrays must be appended in the same order as they were added."
+            )
+        if blocks is not None:
+            self.compressedSize -= nbytes
+            return blocks
+        blocks = self._compressBlocks(data, level, order)
+        if sum(len(b) for b in blocks) != nbytes:
+            raise ValueError("Array modified between addData and appendData.")
+        return blocks
+
     def appendHeader(self, dtype, nelem, ncomp):
         """
         Append size of data block to header.
@@ -580,14 +1376,21 @@ class VtkFile:
         ncomp : int
             number of components, 1 (=scalar) or 3 (=vector)..
         """
+        if self.compressor:
+            raise ValueError("Compressed files can only be written with appendData.")
+        if self.writeWorkers or self.memmap is not None:
+            raise ValueError(
+                "appendHeader cannot be used with writeWorkers or mapAppendedData."
+            )
         self.openAppendedData()
+        self._flushGathered()
         dsize = np_to_vtk[dtype].size
         block_size = dsize * ncomp * nelem
         writeBlockSize(self.xml.stream, block_size)
         # else:  # this routine does not exist!
         #     writeBlockSize64Bit(self.xml.stream, block_size)
 
-    def appendData(self, data):
+    def appendData(self, data, order="F"):
         """
         Append data to binary section.
 
@@ -603,46 +1406,195 @@ class VtkFile:
             All arrays must be one dimensional or three-dimensional.
             The order of the arrays must coincide with
             the numbering scheme of the grid.
+        order : {"F", "C"}, optional
+            Index order of three-dimensional arrays.
+            "F" means arrays are indexed as data[i, j, k],
+            "C" means they are indexed as data[k, j, i],
+            so C contiguous arrays are written without a transposed copy.
+            The default is "F".
 
         Returns
         -------
         VtkFile
             This VtkFile to allow chained calls.
+
+        Notes
+        -----
+        In compressed files, the data was already compressed by addData,
+        so the same arrays must be appended in the same order
+        as they were added.
         """
-        # TODO: Extend this function to accept contiguous C order arrays.
         self.openAppendedData()
-
-        if isinstance(data, tuple):  # 3 numpy arrays
-            ncomp = len(data)
-            assert ncomp == 3
-            dsize = data[0].dtype.itemsize
-            nelem = data[0].size
-            block_size = ncomp * nelem * dsize
-            # if self.largeFile == False:
-            writeBlockSize(self.xml.stream, block_size)
-            # else:
-            #    writeBlockSize64Bit(self.xml.stream, block_size)
-            x, y, z = data[0], data[1], data[2]
-            writeArraysToFile(self.xml.stream, x, y, z)
-
-        elif isinstance(data, np.ndarray) and (
-            data.ndim == 1 or data.ndim == 3
-        ):  # single numpy array
-            ncomp = 1
-            dsize = data.dtype.itemsize
-            nelem = data.size
-            block_size = ncomp * nelem * dsize
-            # if self.largeFile == False:
-            writeBlockSize(self.xml.stream, block_size)
-            # else:
-            #    writeBlockSize64Bit(self.xml.stream, block_size)
-            writeArrayToFile(self.xml.stream, data)
-
+        if self.template is not None:
+            self._checkTemplate(data)
+        self.appended += 1
+
+        blocks = None
+        if self.compressor:
+            blocks = self._compressed(data, order)
+
+        if self.memmap is not None:
+            if not self.views:
+                raise ValueError("appendData called more often than addData.")
+            self._copy(self.views.popleft(), data, order)
+        elif self.writeWorkers:
+            if self.writer is None:
+                self._startPositionalWrites()
+            if len(self.writes) == len(self.arrays):
+                raise ValueError("appendData called more often than addData.")
+            _, offset, _ = self.arrays[len(self.writes)]
+            stream = PositionalWriter(self.xml.stream.fileno(), self.dataStart + offset)
+            future = self.writer.submit(self._write, stream, data, order, blocks)
+            self.writes.append(future)
+        elif self.gatherWrites:
+            if self.gatherer is None:
+                self.xml.stream.flush()
+                self.gatherer = GatherWriter(self.xml.stream.fileno())
+            self._write(self.gatherer, data, order, blocks)
         else:
-            assert False
+            self._write(self.xml.stream, data, order, blocks)
 
         return self
 
+    def _checkTemplate(self, data):
+        """Check that data matches the next array of the template."""
+        if self.appended == len(self.arrays):
+            raise ValueError("appendData called more often than the template allows.")
+        name, _, nbytes = self.arrays[self.appended]
+        dtype, ncomp = self.arrayTypes[self.appended]
+        components = data if isinstance(data, tuple) else (data,)
+        size = sum(a.size for a in components) * dtype.itemsize + 8
+        if (
+            len(components) != ncomp
+            or components[0].dtype.name != dtype.name
+            or size != nbytes
+        ):
+            raise ValueError(
+                "Array %s does not match the template: %d bytes of %s with %d "
+                "components expected, got %d bytes of %s with %d components."
+                % (
+                    name,
+                    nbytes - 8,
+                    dtype.name,
+                    ncomp,
+                    size - 8,
+                    components[0].dtype.name,
+                    len(components),
+                )
+            )
+
+    def mapAppendedData(self):
+        """
+        Map the appended data section of the file into memory.
+
+        Must be called once the header is complete, i.e.
+        after all arrays were added and the grid was closed.
+        The file is preallocated and the block sizes are written,
+        so the arrays can be computed directly into the returned views,
+        e.g. with np.copyto, without intermediate copies.
+        Subsequent calls to appendData copy their data into the next view.
+        The data is flushed to disk by save, after which
+        the views must not be used anymore.
+
+        Returns
+        -------
+        list
+            One writable numpy array per added array, in the order
+            they were added (see arrays for their names).
+            Scalar arrays have shape (nelem,), vector arrays
+            have shape (nelem, ncomp). Elements follow the VTK ordering,
+            so a scalar array v of a grid with shape (nx, ny, nz)
+            is v.reshape((nx, ny, nz), order="F").
+            The views are not necessarily aligned in memory.
+            The list is empty if no arrays were added.
+        """
+        if self.compressor:
+            raise ValueError("Compressed files cannot be mapped.")
+        if self.filename is None:
+            raise ValueError("Only files given by their path can be mapped.")
+        self.openAppendedData()
+        if self.offset == 0:  # no arrays, nothing to map
+            return []
+        self._preallocate()
+        self.memmap = np.memmap(
+            self.filename,
+            dtype="uint8",
+            mode="r+",
+            offset=self.dataStart,
+            shape=(self.offset,),
+        )
+        views = []
+        for (name, offset, nbytes), (dtype, ncomp) in zip(self.arrays, self.arrayTypes):
+            size = np.ndarray((1,), "=u8", self.memmap, offset)
+            size[0] = nbytes - 8
+            nelem = (nbytes - 8) // (ncomp * dtype.itemsize)
+            shape = (nelem,) if ncomp == 1 else (nelem, ncomp)
+            views.append(np.ndarray(shape, dtype, self.memmap, offset + 8))
+        self.views = deque(views)
+        return views
+
+    @staticmethod
+    def _copy(view, data, order):
+        """Copy data to a mapped view in VTK order, see appendData."""
+
+        def indexed(v, a):
+            if a.ndim == 1:
+                return v
+            if order == "C":
+                return v.reshape(a.shape[::-1], order="F").T
+            return v.reshape(a.shape, order="F")
+
+        if isinstance(data, tuple):
+            assert len(data) == 3
+            for i, a in enumerate(data):
+                np.copyto(indexed(view[:, i], a), a)
+        else:
+            np.copyto(indexed(view, data), data)
+
+    def _flushGathered(self):
+        """Write the gathered data and move the stream to the end of it."""
+        if self.gatherer is not None:
+            self.gatherer.flush()
+            self.gatherer = None
+            # the stream did not see the vectored writes
+            stream = self.xml.stream
+            stream.seek(os.lseek(stream.fileno(), 0, os.SEEK_CUR))
+
+    def _preallocate(self):
+        """Reserve the whole file once its header was written."""
+        self._flushGathered()
+        stream = self.xml.stream
+        stream.flush()
+        if stream.tell() != self.xml.size:
+            raise ValueError(
+                "Data was already appended, the appended data cannot be "
+                "preallocated for writeWorkers or mapAppendedData."
+            )
+        self.dataStart = stream.tell()  # position of the appended data
+        preallocateFile(stream.fileno(), self.dataStart + self.offset + len(_FOOTER))
+
+    def _startPositionalWrites(self):
+        """Preallocate the file and start the positional writers."""
+        self._preallocate()
+        self.writer = ThreadPoolExecutor(max_workers=self.writeWorkers)
+
+    def _finishPositionalWrites(self):
+        """Wait for the positional writes and move past the appended data."""
+        try:
+            for future in self.writes:
+                future.result()
+        finally:
+            self.writer.shutdown()
+        self.xml.stream.seek(self.dataStart + self.offset)
+
+    def _write(self, stream, data, order, blocks=None):
+        """Write one array, or its compressed blocks, to a stream."""
+        if blocks is not None:
+            for block in blocks:
+                stream.write(block)
+        else:
+            _writeArray(stream, data, order, self.bufferSize, self.workers)
+
     def openAppendedData(self):
         """
         Open binary section.
@@ -654,6 +1606,16 @@ class VtkFile:
             self.xml.openElement("AppendedData").addAttributes(encoding="raw").addText(
                 "_"
             )
+            if self.gatherWrites:
+                # the header is written with the first gathered arrays
+                self.xml.stream.flush()
+                self.gatherer = GatherWriter(self.xml.stream.fileno())
+                header = self.xml.flush(self.gatherer)
+            else:
+                # the data is written to the stream directly
+                header = self.xml.flush()
+            if len(header) == self.xml.size:
+                self.header = header
             self.appendedDataIsOpen = True
 
     def closeAppendedData(self):
@@ -679,6 +1641,13 @@ class VtkFile:
 
     def save(self):
         """Close file."""
+        if self.writer is not None:
+            self._finishPositionalWrites()
+        self._flushGathered()
+        if self.memmap is not None:
+            self.memmap.flush()
+            self.memmap = None
+            self.xml.stream.seek(self.dataStart + self.offset)
         if self.appendedDataIsOpen:
             self.xml.closeElement("AppendedData")
         self.xml.closeElement("VTKFile")
@@ -694,16 +1663,18 @@ class VtkParallelFile:
 
     Parameters
     ----------
-    filepath : str
-        filename without extension
+    filepath : str or file-like or int
+        filename without extension, a binary file object
+        or a file descriptor open for writing.
     ftype : VtkParallelFileType
     """
 
     def __init__(self, filepath, ftype):
         assert isinstance(ftype, VtkParallelFileType)
         self.ftype = ftype
-        self.filename = filepath + ftype.ext
-        self.xml = XmlWriter(self.filename)
+        target = _get_target(filepath, ftype.ext)
+        self.filename = target if isinstance(target, str) else None
+        self.xml = XmlWriter(target, buffered=True)
         self.xml.openElement("VTKFile").addAttributes(
             type=ftype.name,
             version="1.0",
@@ -713,6 +1684,8 @@ class VtkParallelFile:
 
     def getFileName(self):
         """Return absolute path to this file."""
+        if self.filename is None:
+            return None
         return os.path.abspath(self.filename)
 
     def addPiece(
@@ -857,8 +1830,8 @@ class VtkParallelFile:
             ext = _mix_extents(start, end)
             self.xml.addAttributes(WholeExtent=ext)
 
-        # Ghostlevel
-        self.xml.addAttributes(Ghostlevel=ghostlevel)
+        # GhostLevel, as read by VTK
+        self.xml.addAttributes(GhostLevel=ghostlevel)
         return self
 
     def closeGrid(self):
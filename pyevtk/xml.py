@@ -23,6 +23,15 @@
 ######################################################################################
 """Simple class to generate a well-formed XML file."""
 
+import io
+from functools import lru_cache
+
+
+@lru_cache(maxsize=256)
+def _attributes_format(keys):
+    """Return the format string of attributes with the given names."""
+    return "".join(' %s="%%s"' % key for key in keys)
+
 
 class XmlWriter:
     """
@@ -30,35 +39,111 @@ class XmlWriter:
 
     Parameters
     ----------
-    filepath : str
-        Path to the xml file.
+    filepath : str or file-like
+        Path to the xml file, or a binary file object,
+        which is not closed by close.
+        If None, the xml is written to an in-memory stream,
+        see getValue.
     addDeclaration : bool, optional
         Whether to add the declaration.
         The default is True.
+    buffered : bool, optional
+        Whether to assemble the xml in memory.
+        It is then written to the file in one piece by flush or close,
+        instead of one small write per tag and attribute.
+        The default is False.
     """
 
-    def __init__(self, filepath, addDeclaration=True):
-        self.stream = open(filepath, "wb")
+    def __init__(self, filepath, addDeclaration=True, buffered=False):
+        if filepath is None:
+            self.stream = io.BytesIO()
+        elif hasattr(filepath, "write"):
+            self.stream = filepath
+        else:
+            self.stream = open(filepath, "wb")
+        self.ownsStream = not hasattr(filepath, "write")
+        self.size = 0  # bytes of xml written to the stream
+        self.buffer = [] if buffered else None
         self.openTag = False
         self.current = []
         if addDeclaration:
             self.addDeclaration()
 
+    def write(self, text):
+        """Write text to the file, or to the buffer in buffered mode."""
+        if self.buffer is None:
+            data = str.encode(text)
+            self.stream.write(data)
+            self.size += len(data)
+        else:
+            self.buffer.append(text)
+
+    def flush(self, stream=None):
+        """
+        Write the buffered xml to the file.
+
+        Must be called before writing to the stream directly.
+
+        Parameters
+        ----------
+        stream : file-like, optional
+            stream that writes the xml in place of the file,
+            e.g. to gather it with the data that follows.
+            The default is None.
+
+        Returns
+        -------
+        bytes
+            The xml that was written.
+        """
+        data = str.encode("".join(self.buffer or ()))
+        if data:
+            (stream or self.stream).write(data)
+            self.size += len(data)
+            self.buffer.clear()
+        return data
+
+    def restore(self, data, current):
+        """
+        Write serialized xml, e.g. a cached header.
+
+        Parameters
+        ----------
+        data : bytes
+            xml to write.
+        current : list
+            tags of the elements left open by data, outermost first.
+        """
+        assert not self.openTag
+        self.flush()
+        self.stream.write(data)
+        self.size += len(data)
+        self.current = list(current)
+
     def close(self):
         """Close the file."""
         assert not self.openTag
-        self.stream.close()
+        self.flush()
+        if not self.ownsStream:
+            if hasattr(self.stream, "flush"):
+                self.stream.flush()
+        elif not isinstance(self.stream, io.BytesIO):
+            self.stream.close()
+
+    def getValue(self):
+        """Return the bytes written to an in-memory stream."""
+        self.flush()
+        return self.stream.getvalue()
 
     def addDeclaration(self):
         """Add xml declaration."""
-        self.stream.write(b'<?xml version="1.0"?>')
+        self.write('<?xml version="1.0"?>')
 
     def openElement(self, tag):
         """Open a new xml element."""
         if self.openTag:
-            self.stream.write(b">")
-        st = "\n<%s" % tag
-        self.stream.write(str.encode(st))
+            self.write(">")
+        self.write("\n<%s" % tag)
         self.openTag = True
         self.current.append(tag)
         return self
@@ -81,12 +166,11 @@ class XmlWriter:
         if tag:
             assert self.current.pop() == tag
             if self.openTag:
-                self.stream.write(b">")
+                self.write(">")
                 self.openTag = False
-            st = "\n</%s>" % tag
-            self.stream.write(str.encode(st))
+            self.write("\n</%s>" % tag)
         else:
-            self.stream.write(b"/>")
+            self.write("/>")
             self.openTag = False
             self.current.pop()
         return self
@@ -106,9 +190,9 @@ class XmlWriter:
             The XmlWriter itself for chained calles.
         """
         if self.openTag:
-            self.stream.write(b">\n")
+            self.write(">\n")
             self.openTag = False
-        self.stream.write(str.encode(text))
+        self.write(text)
         return self
 
     def addAttributes(self, **kwargs):
@@ -126,7 +210,6 @@ class XmlWriter:
             The XmlWriter itself for chained calles.
         """
         assert self.openTag
-        for key in kwargs:
-            st = ' %s="%s"' % (key, kwargs[key])
-            self.stream.write(str.encode(st))
+        fmt = _attributes_format(tuple(kwargs))
+        self.write(fmt % tuple(kwargs.values()))
         return self
@@ -75,3 +75,1096 @@ def test_positional_args_only_grid():
         {"pressure": pressure},
         {"temp": temp},
     )
+
+
+@pytest.mark.parametrize("order", ["C", "F"])
+def test_write_array_matches_struct(order):
+    import io
+    import struct
+    from pyevtk.evtk import np_to_struct, writeArrayToFile
+
+    for name, fmt in np_to_struct.items():
+        for byteorder in "<>":
+            dtype = np.dtype(name).newbyteorder(byteorder)
+            data = np.arange(60, dtype=dtype).reshape((5, 4, 3), order=order)
+            stream = io.BytesIO()
+            writeArrayToFile(stream, data)
+            dd = np.ravel(data, order="F")
+            assert stream.getvalue() == struct.pack("=%d%s" % (dd.size, fmt), *dd)
+
+
+def test_write_arrays_interleaved(monkeypatch):
+    import io
+    import struct
+    from pyevtk import evtk
+
+    # small scratch buffer to exercise the splitting of the arrays in slabs
+    monkeypatch.setattr(evtk, "_BUFFER_SIZE", 100)
+    shape = (7, 5, 3)
+    x = np.random.rand(*shape)
+    y = np.asfortranarray(np.random.rand(*shape))
+    z = np.random.rand(*shape).astype(">f8")
+    stream = io.BytesIO()
+    evtk.writeArraysToFile(stream, x, y, z)
+    xx, yy, zz = (np.ravel(a, order="F") for a in (x, y, z))
+    expected = b"".join(struct.pack("=3d", xx[i], yy[i], zz[i]) for i in range(xx.size))
+    assert stream.getvalue() == expected
+
+
+def test_buffer_size(tmp_path):
+    from pyevtk.vtk import VtkFile, VtkImageData
+
+    nx, ny, nz = 9, 7, 5
+    pressure = np.random.rand(nx, ny, nz)
+    velocity = tuple(np.random.rand(nx + 1, ny + 1, nz + 1) for _ in range(3))
+    contents = []
+    for bufferSize in (None, 64, 1):
+        w = VtkFile(str(tmp_path / str(bufferSize)), VtkImageData, bufferSize)
+        w.openGrid(
+            start=(0, 0, 0), end=(nx, ny, nz), origin=(0, 0, 0), spacing=(1, 1, 1)
+        )
+        w.openPiece(start=(0, 0, 0), end=(nx, ny, nz))
+        w.openData("Cell")
+        w.addData("pressure", pressure)
+        w.closeData("Cell")
+        w.openData("Point")
+        w.addData("velocity", velocity)
+        w.closeData("Point")
+        w.closePiece()
+        w.closeGrid()
+        w.appendData(pressure).appendData(velocity)
+        w.save()
+        with open(w.getFileName(), "rb") as f:
+            contents.append(f.read())
+    assert contents[0] == contents[1] == contents[2]
+
+
+def test_c_order(tmp_path):
+    from pyevtk.hl import imageToVTK, gridToVTK
+
+    nx, ny, nz = 6, 5, 4
+    pressure = np.random.rand(nx, ny, nz)
+    temp = np.random.rand(nx + 1, ny + 1, nz + 1)
+    x, y, z = np.meshgrid(
+        np.arange(nx + 1.0), np.arange(ny + 1.0), np.arange(nz + 1.0), indexing="ij"
+    )
+
+    def read(path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    # arrays indexed as [k, j, i] must give the same file as arrays indexed [i, j, k]
+    kji = lambda a: np.ascontiguousarray(a.T)
+    f = imageToVTK(str(tmp_path / "f"), cellData={"p": pressure}, pointData={"t": temp})
+    c = imageToVTK(
+        str(tmp_path / "c"),
+        cellData={"p": kji(pressure)},
+        pointData={"t": kji(temp)},
+        order="C",
+    )
+    assert read(f) == read(c)
+    f = gridToVTK(str(tmp_path / "f"), x, y, z, cellData={"p": pressure})
+    c = gridToVTK(
+        str(tmp_path / "c"),
+        kji(x),
+        kji(y),
+        kji(z),
+        cellData={"p": kji(pressure)},
+        order="C",
+    )
+    assert read(f) == read(c)
+
+
+def test_workers(tmp_path):
+    from pyevtk.hl import gridToVTK
+
+    nx, ny, nz = 30, 20, 10
+    x, y, z = np.meshgrid(
+        np.arange(nx + 1.0), np.arange(ny + 1.0), np.arange(nz + 1.0), indexing="ij"
+    )
+    pressure = np.random.rand(nx, ny, nz)
+    contents = []
+    for workers in (None, 4):
+        path = gridToVTK(
+            str(tmp_path / str(workers)),
+            x,
+            y,
+            z,
+            cellData={"pressure": pressure},
+            workers=workers,
+        )
+        with open(path, "rb") as f:
+            contents.append(f.read())
+    assert contents[0] == contents[1]
+
+
+def test_transpose_tiles(monkeypatch):
+    import io
+    from pyevtk import evtk
+
+    tiles = []
+    copy = evtk._copy_tile
+
+    def record(out, data, tile):
+        tiles.append((data.shape, tile))
+        copy(out, data, tile)
+
+    monkeypatch.setattr(evtk, "_copy_tile", record)
+    data = np.random.rand(100, 3, 70)  # C ordered, indexed as [i, j, k]
+    for workers in (None, 3):
+        del tiles[:]
+        stream = io.BytesIO()
+        evtk.writeArrayToFile(stream, data, workers=workers)
+        assert stream.getvalue() == np.ravel(data, order="F").tobytes()
+        # 64 x 8 x 64 tiles of 256 KiB, cut at the edges of the array
+        assert {tuple(s.stop - s.start for s in t) for _, t in tiles} == {(64, 8, 64)}
+        shapes = [
+            tuple(len(range(*s.indices(n))) for s, n in zip(tile, shape))
+            for shape, tile in tiles
+        ]
+        assert shapes == [(64, 3, 64), (36, 3, 64), (64, 3, 6), (36, 3, 6)]
+    # FORTRAN contiguous arrays and arrays indexed as [k, j, i] are not tiled
+    del tiles[:]
+    evtk.writeArrayToFile(io.BytesIO(), data, order="C", workers=3)
+    evtk.writeArrayToFile(io.BytesIO(), np.asfortranarray(data), workers=3)
+    assert tiles == []
+
+
+def _read_appended(path):
+    """Return the decoded bytes of each appended array of a VTK file."""
+    import lzma
+    import re
+    import struct
+    import zlib
+
+    with open(path, "rb") as f:
+        content = f.read()
+    header, _, data = content.partition(b'<AppendedData encoding="raw">\n_')
+    offsets = [int(o) for o in re.findall(rb'offset="(\d+)"', header)]
+    compressor = re.search(rb'compressor="(\w+)"', header)
+    if compressor is not None:
+        decompress = {
+            b"vtkZLibDataCompressor": zlib.decompress,
+            b"vtkLZMADataCompressor": lzma.decompress,
+        }[compressor.group(1)]
+    arrays = []
+    for offset in offsets:
+        if compressor is None:
+            (size,) = struct.unpack_from("=Q", data, offset)
+            arrays.append(data[offset + 8 : offset + 8 + size])
+            continue
+        nblocks, _, _ = struct.unpack_from("=3Q", data, offset)
+        sizes = struct.unpack_from("=%dQ" % nblocks, data, offset + 24)
+        position = offset + 24 + 8 * nblocks
+        blocks = []
+        for size in sizes:
+            blocks.append(decompress(data[position : position + size]))
+            position += size
+        arrays.append(b"".join(blocks))
+    return arrays
+
+
+def test_zlib_compression(tmp_path):
+    from pyevtk.hl import imageToVTK, unstructuredGridToVTK
+    from pyevtk.vtk import VtkZLibCompressor, VtkTriangle
+
+    nx, ny, nz = 20, 10, 5
+    pressure = np.random.rand(nx, ny, nz)
+    velocity = tuple(np.random.rand(nx + 1, ny + 1, nz + 1) for _ in range(3))
+    kwargs = dict(cellData={"pressure": pressure}, pointData={"velocity": velocity})
+    raw = imageToVTK(str(tmp_path / "raw"), **kwargs)
+    for compression in ("zlib", VtkZLibCompressor(level=9, block_size=1000)):
+        compressed = imageToVTK(str(tmp_path / "z"), compression=compression, **kwargs)
+        assert _read_appended(compressed) == _read_appended(raw)
+        with open(compressed, "rb") as f:
+            serial = f.read()
+        compressed = imageToVTK(
+            str(tmp_path / "z"),
+            compression=compression,
+            compressionWorkers=3,
+            workers=2,
+            **kwargs,
+        )
+        with open(compressed, "rb") as f:
+            assert f.read() == serial
+
+    x = y = z = np.random.rand(6)
+    args = (x, y, z, np.arange(6), np.array([3, 6]), np.full(2, VtkTriangle.tid))
+    raw = unstructuredGridToVTK(str(tmp_path / "raw"), *args)
+    compressed = unstructuredGridToVTK(str(tmp_path / "z"), *args, compression="zlib")
+    assert _read_appended(compressed) == _read_appended(raw)
+
+
+def test_compression_memory(tmp_path):
+    from pyevtk.hl import imageToVTK
+    from pyevtk.vtk import VtkFile, VtkImageData
+
+    a, b = np.random.rand(8, 8, 8), np.zeros((8, 8, 8))
+    expected = imageToVTK(
+        str(tmp_path / "expected"), cellData={"a": a, "b": b}, compression="zlib"
+    )
+
+    def write(path, first, second, bufferSize=None):
+        w = VtkFile(path, VtkImageData, compression="zlib", bufferSize=bufferSize)
+        w.openGrid(
+            start=(0, 0, 0), end=(8, 8, 8), origin=(0.0,) * 3, spacing=(1.0,) * 3
+        )
+        w.openPiece(start=(0, 0, 0), end=(8, 8, 8))
+        w.openData("Cell", scalars="a")
+        w.addData("a", a)
+        w.addData("b", b)
+        w.closeData("Cell")
+        w.closePiece()
+        w.closeGrid()
+        w.appendData(first).appendData(second)
+        w.save()
+        return w
+
+    # no compressed array is kept, so both are compressed again when appended
+    w = write(str(tmp_path / "bounded"), a, b, bufferSize=1)
+    assert w.compressedSize == 0
+    with open(expected, "rb") as f, open(w.getFileName(), "rb") as g:
+        assert f.read() == g.read()
+
+    with pytest.raises(ValueError):
+        write(str(tmp_path / "swapped"), b, a)
+
+
+def test_compressor_levels(tmp_path):
+    from pyevtk.hl import pointsToVTK
+    from pyevtk.vtk import VtkLZMACompressor, VtkZLibCompressor
+
+    x = y = z = np.random.rand(1000)
+    data = {"noise": np.random.rand(1000), "zeros": np.zeros(1000)}
+    raw = pointsToVTK(str(tmp_path / "raw"), x, y, z, data=data)
+    for compression in (
+        "lzma",
+        VtkLZMACompressor(level=1, levels={"connectivity": 9}),
+        VtkZLibCompressor(levels={"points": None, "noise": 0}),
+    ):
+        path = pointsToVTK(str(tmp_path / "c"), x, y, z, data, compression=compression)
+        assert _read_appended(path) == _read_appended(raw)
+
+    # level 0 stores the noise uncompressed with only a few bytes of overhead
+    compressor = VtkZLibCompressor(level=9, levels={"noise": 0})
+    assert compressor.getLevel("noise") == 0
+    assert compressor.getLevel("zeros") == 9
+    block = data["noise"].tobytes()
+    assert len(compressor.compress(block, level=0)) < len(block) + 20
+
+
+def test_adaptive_compression(tmp_path):
+    import itertools
+    from pyevtk.vtk import VtkAdaptiveCompressor, VtkCompressor
+    from pyevtk.vtk import VtkFile, VtkUnstructuredGrid
+
+    class FakeCompressor(VtkCompressor):
+        # level: (compressed size ratio, seconds per MB)
+        costs = {0: (1.0, 0.001), 1: (0.5, 0.01), 2: (0.25, 0.1)}
+        candidate_levels = (0, 1, 2)
+
+        def __init__(self):
+            super().__init__("fake", 0)
+            self.clock = 0.0
+
+        def compress(self, data, level=None):
+            ratio, seconds = self.costs[level]
+            self.clock += seconds * len(data) / 1e6
+            return bytes(int(len(data) * ratio))
+
+    def choose(**kwargs):
+        fake = FakeCompressor()
+        c = VtkAdaptiveCompressor(fake, timer=lambda: fake.clock, **kwargs)
+        return c.chooseLevel([bytes(10**6)])
+
+    # the best ratio that compresses at 50 MB/s, or the fastest level
+    assert choose(throughput=50.0) == 1
+    assert choose(throughput=1e9) == 0
+    # the level that minimizes the time to compress and write
+    assert choose(bandwidth=1.0) == 2
+    assert choose(bandwidth=10.0) == 1
+    assert choose(bandwidth=1e6) == 0
+
+    # with equal measured speeds, arrays that compress get a higher level
+    n = 100000
+    noise = np.random.randint(0, 256, n, dtype="uint8")
+    types = np.full(n, 1, dtype="uint8")
+    timer = itertools.count(step=0.001).__next__
+    compressor = VtkAdaptiveCompressor("zlib", bandwidth=10.0, timer=timer)
+    w = VtkFile(str(tmp_path / "auto"), VtkUnstructuredGrid, compression=compressor)
+    w.openGrid()
+    w.openPiece(npoints=n, ncells=n)
+    w.openData("Point")
+    w.addData("noise", noise)
+    w.addData("types", types)
+    w.closeData("Point")
+    w.closePiece()
+    w.closeGrid()
+    w.appendData(noise).appendData(types)
+    w.save()
+    assert w.compressionLevels["types"] > 0
+    arrays = _read_appended(w.getFileName())
+    assert arrays == [noise.tobytes(), types.tobytes()]
+
+
+def test_precision(tmp_path):
+    from pyevtk.hl import imageToVTK
+
+    nx, ny, nz = 10, 8, 6
+    pressure = np.random.rand(nx, ny, nz)
+    velocity = tuple(np.random.rand(nx, ny, nz) for _ in range(3))
+    flags = np.ones((nx, ny, nz), dtype="int32")
+    cellData = {"pressure": pressure, "velocity": velocity, "flags": flags}
+
+    errors = {}
+    path = imageToVTK(
+        str(tmp_path / "image"),
+        cellData=cellData,
+        precision={"pressure": "float32", "velocity": 10},
+        precisionErrors=errors,
+    )
+    with open(path, "rb") as f:
+        header = f.read(1000)
+    assert b'Name="pressure" NumberOfComponents="1" type="Float32"' in header
+    assert b'Name="velocity" NumberOfComponents="3" type="Float32"' in header
+    assert b'Name="flags" NumberOfComponents="1" type="Int32"' in header
+    assert set(errors) == {"pressure", "velocity"}
+    assert errors["pressure"]["max_rel_error"] == 2.0**-24
+    assert errors["velocity"]["max_rel_error"] == 2.0**-11
+    assert 0 < errors["velocity"]["max_abs_error"] <= 2.0**-11
+
+    pressure32, velocity32, _ = _read_appended(path)
+    assert np.frombuffer(pressure32, "float32").tobytes() == pressure.astype(
+        "float32"
+    ).tobytes(order="F")
+    vx = np.frombuffer(velocity32, "float32")[::3]
+    assert np.allclose(vx, velocity[0].ravel(order="F"), rtol=2.0**-11, atol=0)
+    # trailing 13 bits of the float32 mantissa are zero
+    assert not np.any(np.frombuffer(velocity32, "uint32") & (2**13 - 1))
+
+    # values out of the range of float32 are kept as float64
+    for value in (1e300, 1e-300):
+        errors = {}
+        p = np.full((2, 2, 2), value)
+        p[0] = 1.0
+        path = imageToVTK(
+            str(tmp_path / "range"),
+            cellData={"p": p},
+            precision="float32",
+            precisionErrors=errors,
+        )
+        with open(path, "rb") as f:
+            assert b'type="Float64"' in f.read(1000)
+        (data,) = _read_appended(path)
+        data = np.frombuffer(data, "float64")
+        assert np.allclose(data, p.ravel(order="F"), rtol=2.0**-24, atol=0)
+        assert np.all(data > 0)
+        assert errors["p"]["max_rel_error"] == 2.0**-24
+
+    # big endian data and values that would round up to infinity
+    p = np.random.rand(2, 2, 2).astype(">f8")
+    p[0, 0] = np.finfo("float64").max
+    p[0, 1] = -np.finfo("float64").max
+    errors = {}
+    path = imageToVTK(
+        str(tmp_path / "swapped"),
+        cellData={"p": p},
+        precision=10,
+        precisionErrors=errors,
+    )
+    (data,) = _read_appended(path)
+    data = np.frombuffer(data, "float64")
+    assert np.all(np.isfinite(data))
+    assert np.allclose(data, p.ravel(order="F"), rtol=2.0**-11, atol=0)
+    assert errors["p"]["max_rel_error"] == 2.0**-11
+
+
+def test_plan_layout(tmp_path):
+    from pyevtk.hl import gridToVTK
+    from pyevtk.vtk import VtkRectilinearGrid, planLayout
+
+    nx, ny, nz = 4, 3, 2
+    x = np.arange(nx + 1, dtype="float64")
+    y = np.arange(ny + 1, dtype="float64")
+    z = np.arange(nz + 1, dtype="float64")
+    temp = np.random.rand(nx + 1, ny + 1, nz + 1)
+    pressure = np.random.rand(nx, ny, nz).astype("float32")
+    path = gridToVTK(
+        str(tmp_path / "grid"),
+        x,
+        y,
+        z,
+        pointData={"temp": temp},
+        cellData={"pressure": pressure},
+    )
+
+    npoints = (nx + 1) * (ny + 1) * (nz + 1)
+    layout = planLayout(
+        VtkRectilinearGrid,
+        [
+            ("Coordinates", "x_coordinates", "float64", nx + 1, 1),
+            ("Coordinates", "y_coordinates", "float64", ny + 1, 1),
+            ("Coordinates", "z_coordinates", "float64", nz + 1, 1),
+            ("Point", "temp", "float64", npoints, 1),
+            ("Cell", "pressure", "float32", nx * ny * nz, 1),
+        ],
+        start=(0, 0, 0),
+        end=(nx, ny, nz),
+    )
+    with open(path, "rb") as f:
+        content = f.read()
+    assert layout.getSize() == len(content)
+    assert content.startswith(layout.header)
+    for (name, _, nbytes), pos in zip(layout.arrays, layout.getPositions()):
+        assert content.find(b'Name="%s"' % name.encode()) < layout.headerSize
+        assert np.frombuffer(content[pos : pos + 8], "uint64")[0] == nbytes - 8
+    data = content[layout.getPositions()[3] + 8 :][: npoints * 8]
+    assert data == temp.tobytes(order="F")
+
+
+def test_write_workers(tmp_path):
+    from pyevtk.hl import gridToVTK
+
+    nx, ny, nz = 6, 5, 4
+    x = np.linspace(0.0, 1.0, nx + 1)
+    y = np.linspace(0.0, 1.0, ny + 1)
+    z = np.linspace(0.0, 1.0, nz + 1)
+    pointData = {
+        "temp": np.random.rand(nx + 1, ny + 1, nz + 1),
+        "velocity": tuple(np.random.rand(nx + 1, ny + 1, nz + 1) for _ in range(3)),
+    }
+    cellData = {"ids": np.arange(nx * ny * nz, dtype="int32").reshape(nx, ny, nz)}
+
+    for compression in (None, "zlib"):
+        paths = [
+            gridToVTK(
+                str(tmp_path / ("grid%s" % writeWorkers)),
+                x,
+                y,
+                z,
+                pointData=pointData,
+                cellData=cellData,
+                compression=compression,
+                writeWorkers=writeWorkers,
+            )
+            for writeWorkers in (None, 3)
+        ]
+        with open(paths[0], "rb") as f, open(paths[1], "rb") as g:
+            assert f.read() == g.read()
+
+    # blocks written by appendHeader leave no room for positional writes
+    from pyevtk.vtk import VtkFile, VtkUnstructuredGrid
+
+    a = np.arange(10.0)
+    for writeWorkers in (None, 2):
+        w = VtkFile(
+            str(tmp_path / "header"), VtkUnstructuredGrid, writeWorkers=writeWorkers
+        )
+        assert w.dataStart is None
+        w.openGrid()
+        w.openPiece(npoints=10, ncells=10)
+        w.openData("Point")
+        w.addData("a", a)
+        w.addData("b", a)
+        w.closeData("Point")
+        w.closePiece()
+        w.closeGrid()
+        with pytest.raises(ValueError):
+            if writeWorkers:
+                w.appendHeader("float64", 10, 1)
+            else:
+                w.appendHeader("float64", 10, 1)
+                w.xml.stream.write(a.tobytes())
+                w.mapAppendedData()
+        w.xml.close()
+
+
+def test_memmap(tmp_path):
+    from pyevtk.hl import imageToVTK
+    from pyevtk.vtk import VtkFile, VtkImageData
+
+    nx, ny, nz = 5, 4, 3
+    temp = np.random.rand(nx, ny, nz)
+    velocity = tuple(np.random.rand(nx, ny, nz).astype("float32") for _ in range(3))
+    expected = imageToVTK(
+        str(tmp_path / "expected"),
+        cellData={"temp": temp, "velocity": velocity},
+    )
+
+    for copy in ("views", "appendData"):
+        w = VtkFile(str(tmp_path / copy), VtkImageData)
+        start, end = (0, 0, 0), (nx, ny, nz)
+        w.openGrid(
+            start=start, end=end, origin=(0.0, 0.0, 0.0), spacing=(1.0, 1.0, 1.0)
+        )
+        w.openPiece(start=start, end=end)
+        w.openData("Cell", scalars="temp", vectors="velocity")
+        w.addData("temp", temp)
+        w.addData("velocity", velocity)
+        w.closeData("Cell")
+        w.closePiece()
+        w.closeGrid()
+        t, v = w.mapAppendedData()
+        assert t.shape == (nx * ny * nz,) and v.shape == (nx * ny * nz, 3)
+        if copy == "views":
+            np.copyto(t.reshape((nx, ny, nz), order="F"), temp)
+            for i in range(3):
+                v[:, i] = velocity[i].ravel(order="F")
+        else:
+            w.appendData(temp.T.copy(), order="C")
+            w.appendData(velocity)
+        w.save()
+        with open(expected, "rb") as f, open(w.getFileName(), "rb") as g:
+            assert f.read() == g.read()
+
+    # a file without arrays has nothing to map
+    contents = []
+    for name in ("unmapped", "mapped"):
+        w = VtkFile(str(tmp_path / name), VtkImageData)
+        w.openGrid(start=start, end=end, origin=(0, 0, 0), spacing=(1, 1, 1))
+        w.openPiece(start=start, end=end)
+        w.closePiece()
+        w.closeGrid()
+        if name == "mapped":
+            assert w.mapAppendedData() == []
+        else:
+            w.openAppendedData()
+        w.save()
+        with open(w.getFileName(), "rb") as f:
+            contents.append(f.read())
+    assert contents[0] == contents[1]
+
+
+def test_gather_writes(tmp_path, monkeypatch):
+    from pyevtk.evtk import GatherWriter
+    from pyevtk.hl import pointsToVTK
+
+    n = 100
+    x, y, z = (np.random.rand(n) for _ in range(3))
+    data = {"f%d" % i: np.random.rand(n).astype("float32") for i in range(50)}
+    data["velocity"] = (x, y, z)
+    paths = [
+        pointsToVTK(str(tmp_path / str(g)), x, y, z, data=data, gatherWrites=g)
+        for g in (False, True)
+    ]
+    with open(paths[0], "rb") as f, open(paths[1], "rb") as g:
+        assert f.read() == g.read()
+
+    # the header is written by the first vectored write
+    calls = []
+    writev = os.writev
+
+    def record(fd, buffers):
+        calls.append(bytes(buffers[0][:5]))
+        return writev(fd, buffers)
+
+    monkeypatch.setattr(os, "writev", record)
+    path = pointsToVTK(str(tmp_path / "h"), x, y, z, data=data, gatherWrites=True)
+    assert calls[0] == b"<?xml"
+    with open(paths[0], "rb") as f, open(path, "rb") as g:
+        assert f.read() == g.read()
+    monkeypatch.undo()
+
+    with open(tmp_path / "gathered", "wb") as f:
+        w = GatherWriter(f.fileno(), max_buffers=3)
+        for i in range(11):
+            w.write(bytes([i]) * i)
+        assert len(w.buffers) == 1
+        w.flush()
+    assert (tmp_path / "gathered").read_bytes() == b"".join(
+        bytes([i]) * i for i in range(11)
+    )
+
+
+def test_buffered_xml():
+    from pyevtk.xml import XmlWriter
+
+    writers = [XmlWriter(None), XmlWriter(None, buffered=True)]
+    for xml in writers:
+        xml.openElement("VTKFile").addAttributes(type="Collection", version="0.1")
+        xml.openElement("Collection")
+        for i in range(3):
+            xml.openElement("DataSet")
+            xml.addAttributes(timestep=i, group="", part="0", file="f%d.vtu" % i)
+            xml.closeElement()
+        xml.closeElement("Collection")
+    assert writers[1].stream.tell() == 0  # nothing written yet
+    for xml in writers:
+        xml.closeElement("VTKFile")
+    assert writers[0].getValue() == writers[1].getValue()
+    assert b'<DataSet timestep="2" group="" part="0" file="f2.vtu"/>' in (
+        writers[1].getValue()
+    )
+
+
+def test_file_objects(tmp_path):
+    import io
+    from pyevtk.hl import pointsToVTK, gridToVTK
+    from pyevtk.vtk import VtkGroup
+
+    n = 10
+    x, y, z = (np.random.rand(n) for _ in range(3))
+    data = {"t": np.random.rand(n)}
+    for compression in (None, "zlib"):
+        kwargs = dict(data=data, compression=compression)
+        path = pointsToVTK(str(tmp_path / "points"), x, y, z, **kwargs)
+        with open(path, "rb") as f:
+            expected = f.read()
+        buffer = io.BytesIO()
+        assert pointsToVTK(buffer, x, y, z, **kwargs) is None
+        assert buffer.getvalue() == expected
+
+    # non-seekable pipe
+    r, w = os.pipe()
+    with open(w, "wb") as stream:
+        coords = np.arange(3.0)
+        gridToVTK(stream, coords, coords, coords, writeWorkers=2)
+    with open(r, "rb") as stream:
+        assert stream.read().endswith(b"</AppendedData>\n</VTKFile>")
+
+    # file descriptor, which is left open
+    fd = os.open(str(tmp_path / "fd.vtu"), os.O_WRONLY | os.O_CREAT)
+    try:
+        assert pointsToVTK(fd, x, y, z, **kwargs) is None
+        os.fstat(fd)
+    finally:
+        os.close(fd)
+    with open(tmp_path / "fd.vtu", "rb") as f, open(path, "rb") as g:
+        assert f.read() == g.read()
+    g = VtkGroup(os.open(os.devnull, os.O_WRONLY))
+    g.addFile(filepath="sim0001.vtu", sim_time=0.0)
+    g.save()
+    os.close(g.xml.stream.fileno())
+
+    buffer = io.BytesIO()
+    g = VtkGroup(buffer)
+    g.addFile(filepath="sim0001.vtu", sim_time=0.0)
+    g.save()
+    assert b'file="sim0001.vtu"' in buffer.getvalue()
+    assert not buffer.closed
+
+
+def test_templates(tmp_path):
+    from pyevtk.hl import imageToVTK, pointsToVTK
+
+    templates = {}
+    for step in range(3):
+        n = 10 if step < 2 else 12
+        x, y, z = (np.random.rand(n) for _ in range(3))
+        data = {"t": np.random.rand(n), "v": (x, y, z)}
+        expected = pointsToVTK(str(tmp_path / "expected"), x, y, z, data=data)
+        path = pointsToVTK(
+            str(tmp_path / "points"), x, y, z, data=data, templates=templates
+        )
+        with open(expected, "rb") as f, open(path, "rb") as g:
+            assert f.read() == g.read()
+    assert len(templates) == 2
+
+    cellData = {"p": np.random.rand(3, 4, 5)}
+    paths = [
+        imageToVTK(str(tmp_path / ("image%d" % i)), cellData=cellData, templates=t)
+        for i, t in enumerate((None, templates, templates))
+    ]
+    assert len(templates) == 3
+    with open(paths[0], "rb") as f, open(paths[2], "rb") as g:
+        assert f.read() == g.read()
+
+    # arrays that do not match the template are rejected
+    from pyevtk.vtk import VtkFile, VtkImageData
+
+    layout = next(t for t in templates.values() if len(t.arrays) == 1)
+    for p in (
+        np.random.rand(3, 4, 6),
+        np.random.rand(3, 4, 10).astype("float32"),
+        tuple(np.random.rand(3, 4, 5) for _ in range(3)),
+    ):
+        w = VtkFile(str(tmp_path / "wrong"), VtkImageData, template=layout)
+        with pytest.raises(ValueError):
+            w.appendData(p)
+    w = VtkFile(str(tmp_path / "twice"), VtkImageData, template=layout)
+    w.appendData(cellData["p"])
+    with pytest.raises(ValueError):
+        w.appendData(cellData["p"])
+
+
+def test_background_export(tmp_path):
+    import threading
+    from pyevtk.export import VtkExporter
+    from pyevtk.hl import imageToVTK
+
+    p = np.random.rand(4, 3, 2)
+    expected = imageToVTK(str(tmp_path / "expected"), cellData={"p": p})
+
+    release = threading.Event()
+
+    def blocked(path, **kwargs):
+        release.wait()
+        return imageToVTK(path, **kwargs)
+
+    with VtkExporter(maxsize=2) as exporter:
+        futures = [
+            exporter.submit(blocked, str(tmp_path / ("p%d" % i)), cellData={"p": p})
+            for i in range(2)
+        ]
+        p[:] = 0.0  # snapshots are not affected
+        assert not any(f.done() for f in futures)
+        # the queue is full, so a third export would block
+        assert not exporter.slots.acquire(blocking=False)
+        release.set()
+        paths = [f.result() for f in futures]
+        third = exporter.submit(imageToVTK, str(tmp_path / "p2"), cellData={"p": p})
+    assert third.done()
+    for path in paths:
+        with open(expected, "rb") as f, open(path, "rb") as g:
+            assert f.read() == g.read()
+
+
+def test_background_export_outputs(tmp_path):
+    from pyevtk.export import VtkExporter
+    from pyevtk.hl import imageToVTK
+
+    p = np.random.rand(4, 3, 2)
+    errors, templates = {}, {}
+    with VtkExporter() as exporter:
+        future = exporter.submit(
+            imageToVTK,
+            str(tmp_path / "p"),
+            cellData={"p": p},
+            precision="float32",
+            precisionErrors=errors,
+            templates=templates,
+        )
+        future.result()
+    assert errors["p"]["max_abs_error"] > 0.0
+    assert len(templates) == 1
+
+
+def test_async_export(tmp_path):
+    import asyncio
+    from pyevtk.export import VtkAsyncExporter, VtkAsyncGroup, imageToVTKAsync
+    from pyevtk.hl import imageToVTK
+
+    p = np.random.rand(4, 3, 2)
+    expected = imageToVTK(str(tmp_path / "expected"), cellData={"p": p})
+
+    async def main():
+        exporter = VtkAsyncExporter(maxsize=1)
+        paths = await asyncio.gather(
+            *(
+                imageToVTKAsync(
+                    str(tmp_path / ("p%d" % i)), cellData={"p": p}, exporter=exporter
+                )
+                for i in range(3)
+            )
+        )
+        # an export waiting for a slot is cancelled before it runs
+        blocker = asyncio.ensure_future(
+            exporter.submit(imageToVTK, str(tmp_path / "blocker"), cellData={"p": p})
+        )
+        cancelled = asyncio.ensure_future(
+            exporter.submit(imageToVTK, str(tmp_path / "cancelled"), cellData={"p": p})
+        )
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await blocker
+        group = VtkAsyncGroup(str(tmp_path / "group"))
+        await group.export(
+            imageToVTK, str(tmp_path / "g0"), cellData={"p": p}, sim_time=0.0
+        )
+        await group.save()
+        return paths
+
+    paths = asyncio.run(main())
+    for path in paths:
+        with open(expected, "rb") as f, open(path, "rb") as g:
+            assert f.read() == g.read()
+    assert not (tmp_path / "cancelled.vti").exists()
+    assert b'file="g0.vti"' in (tmp_path / "group.pvd").read_bytes()
+
+
+def _load_snapshot(path):
+    # loader of test_batch_export, run in the worker processes
+    with np.load(path) as f:
+        return path[:-4], {"cellData": {"p": f["p"]}}, float(f["t"])
+
+
+def test_batch_export(tmp_path):
+    from pyevtk.export import exportBatch
+    from pyevtk.hl import imageToVTK
+
+    snapshots = []
+    for i in range(5):
+        path = str(tmp_path / ("snap%d.npz" % i))
+        np.savez(path, p=np.full((3, 2, 2), float(i)), t=0.5 * i)
+        snapshots.append(path)
+    paths = exportBatch(
+        imageToVTK,
+        snapshots,
+        loader=_load_snapshot,
+        group=str(tmp_path / "run"),
+        workers=2,
+        chunksize=2,
+    )
+    assert paths == [os.path.abspath(s[:-4] + ".vti") for s in snapshots]
+    pvd = (tmp_path / "run.pvd").read_bytes()
+    assert pvd.index(b'file="snap0.vti"') < pvd.index(b'file="snap4.vti"')
+    assert b'timestep="2.0"' in pvd
+
+    jobs = [(str(tmp_path / "direct"), {"cellData": {"p": np.zeros((2, 2, 2))}})]
+    assert exportBatch(imageToVTK, jobs, workers=1) == [
+        os.path.abspath(str(tmp_path / "direct.vti"))
+    ]
+
+
+def test_partitioned_export(tmp_path):
+    from pyevtk.hl import partitionedImageToVTK, partitionedGridToVTK
+
+    nx, ny, nz = 6, 4, 3
+    p = np.random.rand(nx, ny, nz)
+    path = partitionedImageToVTK(
+        str(tmp_path / "image"), 4, cellData={"p": p}, ghostlevel=1
+    )
+    index = open(path, "rb").read()
+    assert b'WholeExtent="0 6 0 4 0 3"' in index
+    assert b'GhostLevel="1"' in index
+    assert b'<Piece Extent="0 4 0 3 0 3" Source="image_0.vti"/>' in index
+    assert b'<Piece Extent="2 6 1 4 0 3" Source="image_3.vti"/>' in index
+    (piece,) = _read_appended(str(tmp_path / "image_3.vti"))
+    assert np.frombuffer(piece, "float64").tobytes() == p[2:, 1:, :].tobytes("F")
+
+    x, y, z = (np.linspace(0.0, 1.0, n + 1) for n in (nx, ny, nz))
+    path = partitionedGridToVTK(str(tmp_path / "grid"), x, y, z, 3, cellData={"p": p})
+    index = open(path, "rb").read()
+    assert index.count(b"<Piece ") == 3
+    assert b'<Piece Extent="4 6 0 4 0 3" Source="grid_2.vtr"/>' in index
+
+
+def test_parallel_unstructured_index(tmp_path):
+    from pyevtk.hl import pointsToVTK, writeParallelVTKUnstructuredGrid
+
+    sources = []
+    for rank in range(2):
+        x, y, z = (np.random.rand(4) for _ in range(3))
+        data = {"t": np.random.rand(4).astype("float32"), "v": (x, y, z)}
+        pointsToVTK(str(tmp_path / ("piece_%d" % rank)), x, y, z, data=data)
+        sources.append("piece_%d.vtu" % rank)
+
+    inferred = writeParallelVTKUnstructuredGrid(
+        str(tmp_path / "inferred"), sources, ghostlevel=1
+    )
+    given = writeParallelVTKUnstructuredGrid(
+        str(tmp_path / "given"),
+        sources,
+        ghostlevel=1,
+        pointData={"t": ("float32", 1), "v": ("float64", 3)},
+        pointsType="float64",
+    )
+    index = open(inferred, "rb").read()
+    assert index == open(given, "rb").read()
+    assert b'<PUnstructuredGrid GhostLevel="1">' in index
+    assert b'<DataArray Name="t" NumberOfComponents="1" type="Float32"/>' in index
+    assert b'<DataArray Name="v" NumberOfComponents="3" type="Float64"/>' in index
+    assert b'<Piece Source="piece_1.vtu"/>' in index
+
+
+def test_collective_export(tmp_path):
+    # Also runs on several ranks, e.g.
+    # mpiexec -n 4 python -m pytest tests/dummy.py -k collective
+    MPI = pytest.importorskip("mpi4py.MPI")
+    from pyevtk.hl import collectiveImageToVTK, collectiveGridToVTK
+
+    comm = MPI.COMM_WORLD
+    rank, size = comm.Get_rank(), comm.Get_size()
+    root = comm.bcast(str(tmp_path), root=0)
+    p = np.full((2, 3, 4), rank, dtype="float32")
+    start = (2 * rank, 0, 0)
+
+    path = collectiveImageToVTK(
+        os.path.join(root, "image"), cellData={"p": p}, start=start, comm=comm
+    )
+    x = np.arange(2 * rank, 2 * rank + 3, dtype="float64")
+    y, z = np.arange(4.0), np.arange(5.0)
+    q = np.zeros((3, 4, 5))
+    grid = collectiveGridToVTK(
+        os.path.join(root, "grid"), x, y, z, pointData={"q": q}, start=start
+    )
+    comm.Barrier()
+
+    index = open(path, "rb").read()
+    assert path == os.path.join(root, "image.pvti")
+    assert b'WholeExtent="0 %d 0 3 0 4"' % (2 * size) in index
+    assert b'<DataArray Name="p" NumberOfComponents="1" type="Float32"/>' in index
+    for n in range(size):
+        piece = b'<Piece Extent="%d %d 0 3 0 4" Source="image_%d.vti"/>'
+        assert piece % (2 * n, 2 * n + 2, n) in index
+    index = open(grid, "rb").read()
+    assert b"<PCoordinates>" in index
+    assert index.count(b"<Piece ") == size
+
+    # pieces that do not start at 0
+    start = (2 * rank + 1, 2, 3)
+    path = collectiveGridToVTK(
+        os.path.join(root, "shifted"), x, y, z, pointData={"q": q}, start=start
+    )
+    comm.Barrier()
+    index = open(path, "rb").read()
+    assert b'WholeExtent="1 %d 2 5 3 7"' % (2 * size + 1) in index
+
+
+def _collective_piece(comm, path):
+    from pyevtk import hl
+
+    def read(filename):
+        raise AssertionError("the pieces must not be read back")
+
+    hl._describePiece = read
+    rank = comm.Get_rank()
+    x = np.arange(2 * rank, 2 * rank + 3, dtype="float32")
+    y, z = np.arange(4.0), np.arange(5.0)
+    hl.collectiveGridToVTK(
+        path,
+        x,
+        y,
+        z,
+        cellData={"p": np.full((2, 3, 4), float(rank))},
+        pointData={"q": (np.zeros((3, 4, 5)),) * 3},
+        start=(2 * rank + 1, 2, 3),
+        precision={"p": "float32"},
+        comm=comm,
+    )
+
+
+def test_collective_process_comm(tmp_path):
+    import multiprocessing
+    from pyevtk.export import ProcessComm
+    from pyevtk.hl import writeParallelVTKGrid
+
+    comms = ProcessComm.create(3)
+    path = str(tmp_path / "grid")
+    processes = [
+        multiprocessing.Process(target=_collective_piece, args=(c, path)) for c in comms
+    ]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+    assert all(p.exitcode == 0 for p in processes)
+
+    expected = writeParallelVTKGrid(
+        str(tmp_path / "expected"),
+        coordsData=((7, 4, 5), np.dtype("float32")),
+        starts=[(2 * n + 1, 2, 3) for n in range(3)],
+        ends=[(2 * n + 3, 5, 7) for n in range(3)],
+        sources=["grid_%d.vtr" % n for n in range(3)],
+        cellData={"p": (np.dtype("float32"), 1)},
+        pointData={"q": (np.dtype("float64"), 3)},
+    )
+    with open(path + ".pvtr", "rb") as f, open(expected, "rb") as g:
+        assert f.read() == g.read()
+
+
+def _shared_piece(comm, path):
+    from pyevtk.hl import sharedImageToVTK
+
+    rank = comm.Get_rank()
+    p = np.full((2, 3, 4), rank, dtype="float32")
+    sharedImageToVTK(path, cellData={"p": p}, start=(2 * rank, 0, 0), comm=comm)
+
+
+def test_shared_file(tmp_path):
+    import multiprocessing
+    from pyevtk.export import ProcessComm
+    from pyevtk.hl import imageToVTK, sharedImageToVTK
+
+    # a single rank writes the same file as imageToVTK
+    (comm,) = ProcessComm.create(1)
+    cellData = {"p": np.random.rand(3, 4, 5), "v": (np.ones((3, 4, 5)),) * 3}
+    pointData = {"q": np.random.rand(4, 5, 6).astype("float32")}
+    kwargs = dict(cellData=cellData, pointData=pointData, start=(1, 2, 3))
+    shared = sharedImageToVTK(str(tmp_path / "shared"), comm=comm, **kwargs)
+    single = imageToVTK(str(tmp_path / "single"), **kwargs)
+    assert open(shared, "rb").read() == open(single, "rb").read()
+
+    comms = ProcessComm.create(3)
+    path = str(tmp_path / "image")
+    processes = [
+        multiprocessing.Process(target=_shared_piece, args=(c, path)) for c in comms
+    ]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+    assert all(p.exitcode == 0 for p in processes)
+
+    data = open(path + ".vti", "rb").read()
+    assert b'WholeExtent="0 6 0 3 0 4"' in data
+    assert b'<Piece Extent="4 6 0 3 0 4">' in data
+    header, appended = data.split(b'<AppendedData encoding="raw">\n_')
+    for rank in range(3):
+        offset = rank * (8 + 24 * 4)
+        block = np.frombuffer(appended, "float32", 24, offset + 8)
+        assert (block == rank).all()
+
+
+def _aggregated_piece(comm, path):
+    from pyevtk.hl import aggregatedPointsToVTK
+
+    rank = comm.Get_rank()
+    x = np.full(rank, float(rank))
+    aggregatedPointsToVTK(path, x, x, x, data={"r": x}, aggregators=2, comm=comm)
+
+
+def test_aggregated_export(tmp_path):
+    import multiprocessing
+    from pyevtk.export import ProcessComm
+    from pyevtk.hl import aggregatedPointsToVTK, pointsToVTK
+
+    # a single rank writes the same file as pointsToVTK, and an index
+    (comm,) = ProcessComm.create(1)
+    x, y, z = (np.random.rand(5) for _ in range(3))
+    data = {"t": np.random.rand(5), "v": (x, y, z)}
+    index = aggregatedPointsToVTK(str(tmp_path / "one"), x, y, z, data, comm=comm)
+    single = pointsToVTK(str(tmp_path / "single"), x, y, z, data)
+    assert open(index, "rb").read().count(b"<Piece ") == 1
+    one = open(str(tmp_path / "one_0.vtu"), "rb").read()
+    assert one == open(single, "rb").read()
+
+    # 5 ranks, of which rank 0 has no points, in 2 files
+    comms = ProcessComm.create(5)
+    path = str(tmp_path / "points")
+    processes = [
+        multiprocessing.Process(target=_aggregated_piece, args=(c, path)) for c in comms
+    ]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+    assert all(p.exitcode == 0 for p in processes)
+
+    index = open(path + ".pvtu", "rb").read()
+    assert b'<Piece Source="points_0.vtu"/>' in index
+    assert b'<Piece Source="points_1.vtu"/>' in index
+    files = sorted(f for f in os.listdir(tmp_path) if f.startswith("points"))
+    assert files == [
+        "points.pvtu",
+        "points_0.vtu",
+        "points_1.vtu",
+    ]
+    first = open(path + "_0.vtu", "rb").read()
+    assert b'<Piece NumberOfPoints="1" NumberOfCells="1">' in first
+    assert b'<Piece NumberOfPoints="2" NumberOfCells="2">' in first
+    second = open(path + "_1.vtu", "rb").read()
+    assert second.count(b"<Piece ") == 2
+
+
+def test_parallel_index_start(tmp_path):
+    from pyevtk.hl import imageToVTK, writeParallelVTKImage
+
+    p = np.random.rand(2, 2, 2)
+    starts, ends, sources = [(1, 2, 3), (3, 2, 3)], [(3, 4, 5), (5, 4, 5)], []
+    for n, start in enumerate(starts):
+        imageToVTK(str(tmp_path / ("piece_%d" % n)), cellData={"p": p}, start=start)
+        sources.append("piece_%d.vti" % n)
+    path = writeParallelVTKImage(str(tmp_path / "index"), starts, ends, sources)
+    index = open(path, "rb").read()
+    assert b'WholeExtent="1 5 2 4 3 5"' in index